@@ -0,0 +1,196 @@
+"""
+Admission control - Concurrency limits with a bounded wait queue in front of Ollama
+generations and DePlot extractions, so bursts are rejected quickly instead of piling up
+blocked request threads
+"""
+
+import os
+import asyncio
+import threading
+import time
+import logging
+from contextlib import contextmanager, asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# Limits, overridable through the environment
+LLM_SLOTS = int(os.environ.get('LLM_MAX_CONCURRENCY', 2))
+LLM_MAX_WAITING = int(os.environ.get('LLM_MAX_WAITING', 8))
+LLM_WAIT_TIMEOUT = float(os.environ.get('LLM_WAIT_TIMEOUT', 30))
+DEPLOT_SLOTS = int(os.environ.get('DEPLOT_MAX_CONCURRENCY', 8))
+DEPLOT_MAX_WAITING = int(os.environ.get('DEPLOT_MAX_WAITING', 32))
+DEPLOT_WAIT_TIMEOUT = float(os.environ.get('DEPLOT_WAIT_TIMEOUT', 60))
+# A request waiting on the event loop costs a coroutine rather than a thread, so the ASGI app allows a far longer queue
+LLM_ASYNC_MAX_WAITING = int(os.environ.get('LLM_ASYNC_MAX_WAITING', 1000))
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request cannot be admitted
+
+    status is 429 when the wait queue is already full and 503 when the request
+    waited for a slot until its timeout.
+    """
+
+    def __init__(self, name, status, retry_after):
+        reason = "too many requests waiting" if status == 429 else "timed out waiting for a free slot"
+        super().__init__(f"{name} is overloaded ({reason}), retry in {retry_after}s")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Counting limiter: at most `slots` holders at once and at most `max_waiting`
+    callers blocked waiting for one. Anyone beyond that is rejected immediately.
+    """
+
+    def __init__(self, name, slots, max_waiting, wait_timeout):
+        self.name = name
+        self.slots = max(1, int(slots))
+        self.max_waiting = max(0, int(max_waiting))
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._hold_times = []
+        self._counters = {'admitted': 0, 'queued': 0, 'rejected': 0, 'timed_out': 0, 'wait_ms_total': 0.0}
+
+    def acquire(self, bounded=True):
+        """
+        Take a slot, waiting up to wait_timeout in the queue if none is free
+
+        Args:
+            bounded (bool): If False, wait for a slot however full the queue is and
+                however long it takes; for callers already limited elsewhere
+
+        Raises:
+            Overloaded: If the queue is full (429) or the wait timed out (503)
+        """
+        start = time.monotonic()
+        with self._cond:
+            if self._active >= self.slots:
+                if bounded and self._waiting >= self.max_waiting:
+                    self._counters['rejected'] += 1
+                    raise Overloaded(self.name, 429, self._retry_after())
+                self._waiting += 1
+                self._counters['queued'] += 1
+                try:
+                    admitted = self._cond.wait_for(lambda: self._active < self.slots,
+                                                   self.wait_timeout if bounded else None)
+                finally:
+                    self._waiting -= 1
+                if not admitted:
+                    self._counters['timed_out'] += 1
+                    raise Overloaded(self.name, 503, self._retry_after())
+            self._active += 1
+            self._counters['admitted'] += 1
+            self._counters['wait_ms_total'] += (time.monotonic() - start) * 1000.0
+        return time.monotonic()
+
+    def release(self, acquired_at=None):
+        """Give a slot back; acquired_at is acquire()'s return value, used for Retry-After estimates"""
+        with self._cond:
+            self._active -= 1
+            if acquired_at is not None:
+                self._hold_times.append(time.monotonic() - acquired_at)
+                del self._hold_times[:-20]
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self, bounded=True):
+        """Hold a slot for the duration of a with block"""
+        acquired_at = self.acquire(bounded)
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
+
+    def _retry_after(self):
+        """Rough seconds until a slot frees up for a new caller (lock held)"""
+        average = sum(self._hold_times) / len(self._hold_times) if self._hold_times else 5.0
+        return max(1, int(average * (self._waiting + 1) / self.slots))
+
+    def stats(self):
+        """Slot usage, queue length and admission counters"""
+        with self._cond:
+            stats = dict(self._counters)
+            stats.update({'slots': self.slots, 'active': self._active, 'waiting': self._waiting,
+                          'max_waiting': self.max_waiting, 'wait_timeout': self.wait_timeout})
+            stats['retry_after'] = self._retry_after()
+        stats['avg_wait_ms'] = round(stats.pop('wait_ms_total') / stats['admitted'], 2) if stats['admitted'] else 0.0
+        return stats
+
+
+class AsyncAdmissionController(AdmissionController):
+    """
+    asyncio counterpart of AdmissionController for the ASGI app
+
+    Waiters are suspended coroutines instead of blocked threads. acquire() and
+    release() must be awaited from a single event loop; stats() may be read from
+    any thread.
+    """
+
+    def __init__(self, name, slots, max_waiting, wait_timeout):
+        super().__init__(name, slots, max_waiting, wait_timeout)
+        # Created on first use so it binds to the running event loop
+        self._async_cond = None
+
+    def _condition(self):
+        if self._async_cond is None:
+            self._async_cond = asyncio.Condition()
+        return self._async_cond
+
+    async def acquire(self):
+        """
+        Take a slot, waiting up to wait_timeout in the queue if none is free
+
+        Raises:
+            Overloaded: If the queue is full (429) or the wait timed out (503)
+        """
+        start = time.monotonic()
+        cond = self._condition()
+        async with cond:
+            if self._active >= self.slots:
+                if self._waiting >= self.max_waiting:
+                    self._counters['rejected'] += 1
+                    raise Overloaded(self.name, 429, self._retry_after())
+                self._waiting += 1
+                self._counters['queued'] += 1
+                try:
+                    await asyncio.wait_for(cond.wait_for(lambda: self._active < self.slots), self.wait_timeout)
+                except asyncio.TimeoutError:
+                    self._counters['timed_out'] += 1
+                    raise Overloaded(self.name, 503, self._retry_after())
+                finally:
+                    self._waiting -= 1
+            self._active += 1
+            self._counters['admitted'] += 1
+            self._counters['wait_ms_total'] += (time.monotonic() - start) * 1000.0
+        return time.monotonic()
+
+    async def release(self, acquired_at=None):
+        """Give a slot back; acquired_at is acquire()'s return value, used for Retry-After estimates"""
+        cond = self._condition()
+        async with cond:
+            self._active -= 1
+            if acquired_at is not None:
+                self._hold_times.append(time.monotonic() - acquired_at)
+                del self._hold_times[:-20]
+            cond.notify()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a slot for the duration of an async with block"""
+        acquired_at = await self.acquire()
+        try:
+            yield
+        finally:
+            await self.release(acquired_at)
+
+
+# Process-wide limiters for LLM generations and DePlot extractions
+llm_admission = AdmissionController('LLM', LLM_SLOTS, LLM_MAX_WAITING, LLM_WAIT_TIMEOUT)
+deplot_admission = AdmissionController('DePlot', DEPLOT_SLOTS, DEPLOT_MAX_WAITING, DEPLOT_WAIT_TIMEOUT)
+# LLM limiter for the ASGI app's endpoints; the sync limiter still guards Flask's LLM calls
+llm_async_admission = AsyncAdmissionController('LLM', LLM_SLOTS, LLM_ASYNC_MAX_WAITING, LLM_WAIT_TIMEOUT)
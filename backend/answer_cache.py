@@ -0,0 +1,64 @@
+"""
+Answer cache - Cache of LLM answers to chart questions, keyed by the normalized question,
+a hash of the table, the title, the model and the prompt template
+"""
+
+import os
+import re
+import hashlib
+import json
+
+from cache import TieredCache, MISSING
+from prompt_builder import PROMPT_TEMPLATE_VERSION, PROMPT_TOKEN_BUDGET
+
+# Cache configuration, overridable through the environment
+CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_SIZE', 1024))
+CACHE_TTL = int(os.environ.get('ANSWER_CACHE_TTL', 24 * 3600))
+CACHE_DB_PATH = os.environ.get('ANSWER_CACHE_DB') or None
+
+answer_cache = TieredCache('answers', CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_DB_PATH)
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return WHITESPACE.sub(' ', question.strip().lower()).rstrip(' ?!.')
+
+
+def answer_key(question, table_data, title, model):
+    """
+    Build the cache key for a question about a table
+
+    The key covers the prompt template version and token budget, so changing how
+    prompts are built never serves answers generated from the old prompts.
+    """
+    params = [
+        normalize_question(question),
+        hashlib.sha256(table_data.encode('utf-8')).hexdigest(),
+        title,
+        model,
+        PROMPT_TEMPLATE_VERSION,
+        PROMPT_TOKEN_BUDGET,
+    ]
+    return hashlib.sha256(json.dumps(params).encode('utf-8')).hexdigest()
+
+
+def get_cached_answer(key):
+    """
+    Look up a cached answer
+
+    Returns:
+        str or None: The answer on a hit
+    """
+    value = answer_cache.get(key)
+    if value is MISSING:
+        return None
+    return value
+
+
+def cache_answer(key, answer):
+    """Store an answer; error messages are never cached"""
+    if not answer or answer.startswith("Error:"):
+        return
+    answer_cache.set(key, answer)
@@ -4,22 +4,40 @@ Flask backend server for Chart Analysis Assistant
 This server provides API endpoints to extract data from charts and ask questions about them
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context, g
 from flask_cors import CORS
 import os
+import hmac
 import logging
-from werkzeug.utils import secure_filename
 import json
 import time
-from functools import wraps
 from werkzeug.serving import WSGIRequestHandler
 import socket
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import zipfile
 
 # Import the functionality from the Python code
-from chart_analyzer import extract_table_from_chart, ask_local_llm, check_ollama_status
+from startup import startup_monitor, STARTED_AT
+from chart_analyzer import extract_table_from_chart, ask_local_llm, stream_local_llm, LLMStreamError, ImageTooLargeError
+from chart_analyzer import generate_reply, stream_reply
+from prompt_builder import build_prompt
+from session_store import session_store
+from admission import llm_admission, deplot_admission, llm_async_admission, Overloaded
+from answer_cache import answer_cache, answer_key, get_cached_answer, cache_answer
+from model_registry import registry as model_registry
+from ollama_client import ollama
+from ollama_health import health_monitor, get_ollama_status
+from batching import batcher
+from singleflight import extraction_flight, question_flight, question_async_flight, question_key
+from bulk import extract_many, iter_zip
+from panels import extract_tables_from_dashboard
+from query_engine import answer_question
+from jobs import job_queue, JobQueueFull, DONE, FAILED
+from generation import resolve_profile
+from table import ORIENTS
+from metrics import metrics, extraction_stage_seconds, http_requests, http_request_seconds, http_in_flight
+from extraction_cache import extraction_cache, extraction_key, image_hash, get_cached_extraction, cache_extraction, get_cached_panels, cache_panels
+
+startup_monitor.mark('app_imports', STARTED_AT)
 
 # Configure logging
 logging.basicConfig(
@@ -43,14 +61,9 @@ CORS(app, resources={
     }
 })  # Enable CORS for all routes
 
-# Configure upload folder for chart images
-UPLOAD_FOLDER = 'uploads'
+# Chart image types accepted for upload; uploads are decoded in memory, never written to disk
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
-# Create uploads folder if it doesn't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
 app.config['TIMEOUT'] = 60  # Increase timeout to 60 seconds
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour session lifetime
@@ -61,72 +74,296 @@ app.secret_key = os.urandom(24)
 # Configure socket options for better connection handling
 WSGIRequestHandler.protocol_version = "HTTP/1.1"
 
-# Configure requests session with retry strategy
-session = requests.Session()
-retry_strategy = Retry(
-    total=3,
-    backoff_factor=1,
-    status_forcelist=[500, 502, 503, 504],
-)
-adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=10, pool_maxsize=10)
-session.mount("http://", adapter)
-session.mount("https://", adapter)
-
-# Cache for Ollama status
-ollama_status_cache = {
-    'last_check': 0,
-    'status': None,
-    'models': None,
-    'cache_duration': 30  # Cache for 30 seconds
+# Added to every response, here and by the ASGI app
+SECURITY_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'SAMEORIGIN',
+    'X-XSS-Protection': '1; mode=block',
+    'Strict-Transport-Security': 'max-age=31536000; includeSubDomains'
 }
 
-def get_cached_ollama_status():
-    """Get cached Ollama status or check if cache is expired"""
-    current_time = time.time()
-    if current_time - ollama_status_cache['last_check'] < ollama_status_cache['cache_duration']:
-        return ollama_status_cache['status'], ollama_status_cache['models']
-    return None, None
-
-def update_ollama_status_cache(status, models):
-    """Update the Ollama status cache"""
-    ollama_status_cache['last_check'] = time.time()
-    ollama_status_cache['status'] = status
-    ollama_status_cache['models'] = models
+# Queue depths, cache counters and readiness are read from the existing stats at scrape time
+metrics.gauge('chartqa_queue_depth', 'Work waiting in each queue', ('queue',), lambda: {
+    ('deplot_batch',): batcher.stats()['queue_depth'],
+    ('extraction_jobs',): job_queue.stats()['queue_depth'],
+    ('llm_admission',): llm_admission.stats()['waiting'],
+    ('deplot_admission',): deplot_admission.stats()['waiting'],
+    ('llm_async_admission',): llm_async_admission.stats()['waiting'],
+})
+metrics.gauge('chartqa_admission_active', 'Admission slots currently held', ('limiter',), lambda: {
+    ('llm',): llm_admission.stats()['active'],
+    ('deplot',): deplot_admission.stats()['active'],
+    ('llm_async',): llm_async_admission.stats()['active'],
+})
+metrics.callback_counter('chartqa_admission_rejected_total', 'Requests rejected by admission control', ('limiter', 'reason'), lambda: {
+    (name, reason): admission.stats()[reason]
+    for name, admission in (('llm', llm_admission), ('deplot', deplot_admission), ('llm_async', llm_async_admission))
+    for reason in ('rejected', 'timed_out')
+})
+metrics.callback_counter('chartqa_cache_lookups_total', 'Cache lookups by cache and result', ('cache', 'result'), lambda: {
+    (name, result): cache.stats()[result]
+    for name, cache in (('extraction', extraction_cache), ('answer', answer_cache))
+    for result in ('hits', 'misses')
+})
+metrics.callback_counter('chartqa_coalesced_requests_total', 'Requests that joined an identical in-flight call', ('kind',), lambda: {
+    ('extract',): extraction_flight.stats()['followers'],
+    ('question',): question_flight.stats()['followers'] + question_async_flight.stats()['followers'],
+})
+metrics.gauge('chartqa_sessions', 'Conversation sessions held', (), lambda: session_store.stats()['sessions'])
+metrics.gauge('chartqa_model_ready', '1 once DePlot is loaded and warmed up', (), lambda: int(startup_monitor.ready))
 
 # Helper function to check if file extension is allowed
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def extract_uploaded_chart(file, profile=None, timings=None):
+    """
+    Extract table data from an uploaded chart image
+    
+    Args:
+        file (FileStorage): Uploaded image
+        profile (str): Generation profile name; the default profile if None
+        timings (dict): Optional dict that receives per-stage durations
+        
+    Returns:
+        ChartTable: Unpacks as (title, headers, data, formatted_table, raw_output)
+    """
+    return extract_chart_bytes(file.filename, read_upload(file), profile, timings)
+
+def read_upload(file):
+    """Read an uploaded file's bytes, recording the upload_read stage"""
+    start = time.monotonic()
+    image_bytes = file.read()
+    extraction_stage_seconds.observe(time.monotonic() - start, stage='upload_read')
+    return image_bytes
+
+def extract_chart_bytes(filename, image_bytes, profile=None, timings=None, bounded=True):
+    """
+    Extract table data from the raw bytes of a chart image
+    
+    The upload is decoded straight from memory. Cached uploads skip the model;
+    identical uploads arriving while one is being decoded wait for that decode
+    instead of starting their own; their timings are copies of that decode's,
+    marked with coalesced=1. A new decode needs a DePlot admission slot;
+    with bounded=False it waits for one as long as it takes instead of being
+    rejected (job workers are already limited by the job queue).
+    
+    Raises:
+        Overloaded: If no DePlot slot is available (only when bounded)
+    """
+    cache_key = extraction_key(image_hash(image_bytes), profile)
+    extraction = get_cached_extraction(cache_key)
+    if extraction is not None:
+        logger.info("Extraction cache hit")
+        if timings is not None:
+            timings['cache_hit'] = 1
+        return extraction
+    logger.info(f"Processing image: {filename}")
+    own_timings = {}
+    extraction, stage_timings = extraction_flight.do(
+        cache_key, _extract_and_cache, image_bytes, cache_key, profile, own_timings, bounded
+    )
+    if timings is not None:
+        timings.update(stage_timings)
+        if stage_timings is not own_timings:
+            timings['coalesced'] = 1
+    return extraction
+
+def _extract_and_cache(image_bytes, cache_key, profile=None, timings=None, bounded=True):
+    """
+    Decode the upload in memory, extract its table and cache the result
+    
+    Returns:
+        tuple: (extraction, timings), so coalesced callers get the decode's timings too
+    """
+    with deplot_admission.slot(bounded):
+        extraction = extract_table_from_chart(image_bytes, timings, profile)
+    cache_extraction(cache_key, extraction)
+    return extraction, timings
+
+def extract_job(filename, image_bytes, profile=None, timings=None):
+    """
+    Job queue entry point for an extraction
+    
+    Jobs share the DePlot slots with synchronous extractions, so both together
+    never exceed DEPLOT_MAX_CONCURRENCY. A job waits for its slot rather than
+    failing: it was already accepted by the job queue.
+    """
+    return extract_chart_bytes(filename, image_bytes, profile, timings, bounded=False)
+
+def request_profile():
+    """
+    Generation profile requested in the form data or query string
+    
+    Raises:
+        ValueError: If the profile is unknown
+    """
+    profile = request.form.get('profile') or request.args.get('profile')
+    return resolve_profile(profile)[0]
+
+def request_orient():
+    """
+    Payload orientation requested in the form data or query string ('rows' or 'columns')
+    
+    Raises:
+        ValueError: If the orientation is unknown
+    """
+    orient = request.form.get('orient') or request.args.get('orient') or 'rows'
+    if orient not in ORIENTS:
+        raise ValueError(f"Unknown orient '{orient}', expected one of {', '.join(ORIENTS)}")
+    return orient
+
+def extraction_response(extraction, orient='rows'):
+    """Build the /extract JSON payload from an extracted ChartTable"""
+    return extraction.to_dict(orient)
+
+def query_engine_answer(request_data):
+    """
+    Answer a question deterministically from the table when possible
+    
+    Returns None when the client disabled the engine or no intent matched,
+    in which case the question goes to the LLM.
+    """
+    if not request_data.get("use_query_engine", True):
+        return None
+    result = answer_question(request_data["question"], request_data["table_data"])
+    if result is not None:
+        logger.info(f"Question answered by query engine ({result.intent})")
+    return result
+
+def llm_answer(question_text, table_data, title, model, use_cache=True):
+    """
+    Answer a question with the LLM, going through the answer cache
+    
+    Identical concurrent questions share one generation. With use_cache False
+    the lookup is skipped, but the fresh answer still replaces the cached one.
+    
+    Returns:
+        tuple: (answer, cached)
+    """
+    cache_key = answer_key(question_text, table_data, title, model)
+    if use_cache:
+        answer = get_cached_answer(cache_key)
+        if answer is not None:
+            logger.info("Answer cache hit")
+            return answer, True
+    answer = question_flight.do(
+        question_key(question_text, table_data, title, model),
+        _ask_and_cache, question_text, table_data, title, model, cache_key
+    )
+    return answer, False
+
+def _ask_and_cache(question_text, table_data, title, model, cache_key):
+    """Ask the LLM within an admission slot and cache a successful answer"""
+    with llm_admission.slot():
+        answer = ask_local_llm(question_text, table_data, title, model)
+    cache_answer(cache_key, answer)
+    return answer
+
+def stream_llm_answer(question_text, table_data, title, model, use_cache=True):
+    """Stream an LLM answer as Server-Sent Events, replaying cached answers as a single token"""
+    cache_key = answer_key(question_text, table_data, title, model)
+    if use_cache:
+        answer = get_cached_answer(cache_key)
+        if answer is not None:
+            logger.info("Answer cache hit")
+            return stream_answer(single_answer(answer), "answer")
+    acquired_at = llm_admission.acquire()
+    response = stream_answer(
+        stream_local_llm(question_text, table_data, title, model), "answer",
+        on_complete=lambda answer: cache_answer(cache_key, answer)
+    )
+    return hold_until_closed(response, llm_admission, acquired_at)
+
+def hold_until_closed(response, admission, acquired_at):
+    """Release an admission slot once a streamed response finishes or the client goes away"""
+    response.call_on_close(lambda: admission.release(acquired_at))
+    return response
+
+def overloaded_response(error):
+    """429/503 response with Retry-After for a request that could not be admitted"""
+    logger.warning(str(error))
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, error.status
+
+def single_answer(answer):
+    """Token generator yielding a precomputed answer, for stream_answer"""
+    yield answer
+
+def sse_event(payload, event=None):
+    """Format a JSON payload as a Server-Sent Events message"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(payload)}\n\n"
+
+def stream_answer(tokens, result_key, on_complete=None):
+    """
+    Relay an LLM token generator to the client as Server-Sent Events
+    
+    Each token is sent as a `data: {"token": ...}` message, followed by a final
+    `done` event carrying the full text under result_key, or an `error` event.
+    If the client disconnects the token generator is closed, which cancels the
+    upstream Ollama generation.
+    
+    Args:
+        tokens (generator): Output of stream_local_llm
+        result_key (str): Key of the full text in the final event ("answer" or "result")
+        on_complete (callable): Called with the full text once the stream finishes
+    """
+    def events():
+        parts = []
+        try:
+            for token in tokens:
+                parts.append(token)
+                yield sse_event({"token": token})
+        except LLMStreamError as e:
+            yield sse_event({"error": f"Error: {str(e)}"}, event="error")
+            return
+        finally:
+            tokens.close()
+        answer = "".join(parts)
+        if on_complete:
+            on_complete(answer)
+        yield sse_event({result_key: answer}, event="done")
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.before_request
 def before_request():
     """Set timeout for all requests"""
-    request.environ['werkzeug.socket'].settimeout(app.config['TIMEOUT'])
+    g.request_started = time.monotonic()
+    http_in_flight.inc()
+    # Only werkzeug's own server exposes the socket (not the ASGI app's WSGI bridge)
+    sock = request.environ.get('werkzeug.socket')
+    if sock is not None:
+        sock.settimeout(app.config['TIMEOUT'])
+
+@app.teardown_request
+def teardown_request(exc=None):
+    """Count the request as finished (after a streamed body has been sent)"""
+    if 'request_started' in g:
+        http_in_flight.dec()
 
 @app.after_request
 def after_request(response):
     """Add security headers and handle CORS"""
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'SAMEORIGIN'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
-    response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
+    if 'request_started' in g:
+        endpoint = request.endpoint or 'unmatched'
+        http_request_seconds.observe(time.monotonic() - g.request_started, endpoint=endpoint)
+        http_requests.inc(endpoint=endpoint, status=str(response.status_code))
+    response.headers.update(SECURITY_HEADERS)
     return response
 
 @app.route('/status', methods=['GET'])
 def status():
     """Endpoint to check backend status with connection test"""
     try:
-        # Check cache first
-        cached_status, cached_models = get_cached_ollama_status()
-        if cached_status is not None:
-            return jsonify({
-                "status": "Backend is running",
-                "ollama_available": cached_status,
-                "available_models": cached_models
-            }), 200
-
-        # Test Ollama connection if cache is expired
-        ollama_running, available_models = check_ollama_status()
-        update_ollama_status_cache(ollama_running, available_models)
+        # Read the background health monitor's snapshot instead of probing Ollama
+        ollama_running, available_models = get_ollama_status()
         
         return jsonify({
             "status": "Backend is running",
@@ -137,54 +374,70 @@ def status():
         logger.error(f"Status check failed: {str(e)}")
         return jsonify({"status": "Backend is running but Ollama check failed"}), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text-format metrics"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests, whether or not the model is ready"""
+    return jsonify({"status": "alive", "uptime_s": startup_monitor.status()["uptime_s"]}), 200
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 200 once DePlot is loaded and warmed up, 503 before that or if loading failed"""
+    # Servers that import the app without running __main__ start the warmup on the first probe
+    startup_monitor.start()
+    status = startup_monitor.status()
+    status["model_loaded"] = model_registry.loaded
+    status["ollama_available"] = health_monitor.snapshot().available
+    return jsonify(status), 200 if startup_monitor.ready else 503
+
 @app.route('/full-status', methods=['GET'])
 def full_status():
     """Comprehensive status check including Ollama"""
     logger.info("Checking full system status")
     
-    # Check Ollama status
-    ollama_running, available_models = check_ollama_status()
-    logger.info(f"Ollama status: running={ollama_running}, models={available_models}")
-    
-    # Add debug information
-    debug_info = {}
+    # Read the latest Ollama health snapshot
+    snapshot = health_monitor.snapshot()
+    logger.info(f"Ollama status: running={snapshot.available}, models={list(snapshot.models)}")
     
-    try:
-        # Try to get the detailed Ollama status
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+    # Add debug information from the last probe
+    debug_info = {"checked_at": snapshot.checked_at, "latency_ms": snapshot.latency_ms}
+    if snapshot.status_code is not None:
+        content = snapshot.raw_response or ""
         debug_info["ollama_response"] = {
-            "status_code": response.status_code,
-            "content_sample": str(response.text)[:200] + "..." if len(response.text) > 200 else response.text
+            "status_code": snapshot.status_code,
+            "content_sample": content[:200] + "..." if len(content) > 200 else content
         }
-    except Exception as e:
-        debug_info["ollama_error"] = str(e)
+    if snapshot.error:
+        debug_info["ollama_error"] = snapshot.error
     
     return jsonify({
         "status": "ok", 
-        "ollama_available": ollama_running,
-        "available_models": available_models,
+        "ollama_available": snapshot.available,
+        "available_models": list(snapshot.models),
         "debug_info": debug_info
     }), 200
 
 @app.route('/ollama-check', methods=['GET'])
 def ollama_check():
     """Direct check of Ollama status"""
-    logger.info("Directly checking Ollama status")
+    logger.info("Checking Ollama status snapshot")
     
-    ollama_running, available_models = check_ollama_status()
+    snapshot = health_monitor.snapshot()
     
-    debug_info = {}
-    # Try a direct request to Ollama
-    try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
-        debug_info["status_code"] = response.status_code
-        debug_info["raw_response"] = response.text[:500]  # First 500 chars
-    except Exception as e:
-        debug_info["error"] = str(e)
+    debug_info = {"checked_at": snapshot.checked_at, "latency_ms": snapshot.latency_ms}
+    if snapshot.status_code is not None:
+        debug_info["status_code"] = snapshot.status_code
+        debug_info["raw_response"] = snapshot.raw_response  # First 500 chars
+    if snapshot.error:
+        debug_info["error"] = snapshot.error
     
     return jsonify({
-        "available": ollama_running,
-        "models": available_models,
+        "available": snapshot.available,
+        "models": list(snapshot.models),
         "debug_info": debug_info
     }), 200
 
@@ -194,47 +447,36 @@ def test_ollama():
     logger.info("Testing Ollama with simple prompt")
     
     try:
-        # First check if Ollama is accessible at all
-        try:
-            # Try to connect to Ollama API
-            response = requests.get("http://localhost:11434/api/tags", timeout=5)
-            if response.status_code != 200:
+        # First check if Ollama is accessible at all, using the health monitor's last probe
+        snapshot = health_monitor.snapshot()
+        if not snapshot.available:
+            if snapshot.status_code is not None:
                 return jsonify({
                     "success": False,
-                    "message": f"Ollama API returned status {response.status_code}",
-                    "response": response.text[:100] if response.text else ""
+                    "message": f"Ollama API returned status {snapshot.status_code}",
+                    "response": (snapshot.raw_response or "")[:100]
                 }), 200
-        except Exception as e:
             return jsonify({
                 "success": False,
-                "message": f"Cannot connect to Ollama API: {str(e)}",
+                "message": f"Cannot connect to Ollama API: {snapshot.error}",
             }), 200
         
-        # If we got here, we can connect to the Ollama API, now test a model
-        # First get available models
-        models_response = requests.get("http://localhost:11434/api/tags", timeout=5)
-        models_data = models_response.json()
-        
-        if not models_data.get("models"):
+        if not snapshot.models:
             return jsonify({
                 "success": False,
                 "message": "Ollama is running but no models are available. Pull a model with 'ollama pull llama3'",
             }), 200
         
         # Use the first available model
-        model_to_test = models_data["models"][0]["name"]
+        model_to_test = snapshot.models[0]
         logger.info(f"Testing Ollama with model: {model_to_test}")
         
         # Try a simple generation
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={
-                "model": model_to_test,
-                "prompt": "Say hello",
-                "stream": False
-            },
-            timeout=10
-        )
+        response = ollama.generate({
+            "model": model_to_test,
+            "prompt": "Say hello",
+            "stream": False
+        }, timeout=10)
         
         if response.status_code == 200:
             data = response.json()
@@ -260,7 +502,7 @@ def test_ollama():
 @app.route('/models', methods=['GET'])
 def models():
     """Get available LLM models"""
-    ollama_running, available_models = check_ollama_status()
+    ollama_running, available_models = get_ollama_status()
     if ollama_running:
         return jsonify({"models": available_models}), 200
     else:
@@ -286,49 +528,187 @@ def extract():
         return jsonify({"error": "File type not allowed"}), 400
     
     try:
-        # Save the uploaded file temporarily
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        logger.info(f"Processing image: {filepath}")
-        
-        # Extract table data from the image
-        title, headers, data, formatted_table, table_str = extract_table_from_chart(filepath)
-        
-        logger.info(f"Extraction complete. Title: {title}, Headers: {headers}, Data rows: {len(data)}")
-        logger.debug(f"Raw table string: {table_str}")
+        profile = request_profile()
+        orient = request_orient()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        # Identical uploads are served from the cache, and concurrent duplicates share one decode
+        extraction = extract_uploaded_chart(file, profile)
         
-        # Convert data to JSON-serializable format
-        serializable_data = []
-        for row in data:
-            row_dict = {}
-            for i, header in enumerate(headers):
-                if i < len(row):
-                    row_dict[header] = row[i]
-            serializable_data.append(row_dict)
+        logger.info(f"Extraction complete. Title: {extraction.title}, Headers: {extraction.headers}, Data rows: {len(extraction.data)}")
+        logger.debug(f"Raw table string: {extraction.raw_output}")
         
-        result = {
-            "title": title,
-            "headers": headers,
-            "data": serializable_data,
-            "formatted_table": formatted_table,
-            "raw_text": table_str
-        }
+        result = extraction_response(extraction, orient)
         
         logger.info("Sending extraction results to frontend")
         return jsonify(result), 200
         
+    except ImageTooLargeError as e:
+        logger.error(f"Rejected image: {str(e)}")
+        return jsonify({"error": str(e)}), 413
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        # Clean up the uploaded file
+
+@app.route('/extract-panels', methods=['POST'])
+def extract_panels():
+    """Extract one table per chart from a dashboard image holding several charts"""
+    if 'image' not in request.files:
+        logger.error("No image file in request")
+        return jsonify({"error": "No image file provided"}), 400
+    
+    file = request.files['image']
+    
+    if file.filename == '':
+        logger.error("Empty filename")
+        return jsonify({"error": "No selected file"}), 400
+    
+    if not allowed_file(file.filename):
+        logger.error(f"Invalid file type: {file.filename}")
+        return jsonify({"error": "File type not allowed"}), 400
+    
+    try:
+        profile = request_profile()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        image_bytes = read_upload(file)
+        cache_key = extraction_key(image_hash(image_bytes), profile) + ":panels"
+        panels = get_cached_panels(cache_key)
+        if panels is None:
+            panels = extraction_flight.do(cache_key, _extract_panels_and_cache, image_bytes, cache_key, profile)
+        else:
+            logger.info("Panel extraction cache hit")
+        
+        logger.info(f"Panel extraction complete: {len(panels)} panels")
+        return jsonify({"panels": list(panels)}), 200
+        
+    except ImageTooLargeError as e:
+        logger.error(f"Rejected image: {str(e)}")
+        return jsonify({"error": str(e)}), 413
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Error processing dashboard image: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def _extract_panels_and_cache(image_bytes, cache_key, profile=None):
+    """Extract every panel of a dashboard image and cache the list of tables"""
+    with deplot_admission.slot():
+        panels = extract_tables_from_dashboard(image_bytes, profile)
+    cache_panels(cache_key, panels)
+    return panels
+
+@app.route('/bulk-extract', methods=['POST'])
+def bulk_extract():
+    """Extract many charts (form files 'images' and/or zip files 'archive') as streamed JSON Lines"""
+    images = [f for f in request.files.getlist('images') if f.filename and allowed_file(f.filename)]
+    archives = [f for f in request.files.getlist('archive') if f.filename]
+    if not images and not archives:
+        return jsonify({"error": "No images or archives provided"}), 400
+    
+    try:
+        profile = request_profile()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    def sources():
+        for file in images:
+            yield file.filename, (lambda data=file.read(): data)
+        for archive in archives:
+            yield from iter_zip(archive.stream, prefix=archive.filename + "!")
+    
+    def records():
         try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-        except:
-            pass
+            for record in extract_many(sources(), profile=profile):
+                yield json.dumps(record) + "\n"
+        except zipfile.BadZipFile as e:
+            yield json.dumps({"error": f"Invalid archive: {str(e)}"}) + "\n"
+    
+    logger.info(f"Bulk extraction of {len(images)} images and {len(archives)} archives")
+    return Response(stream_with_context(records()), mimetype='application/x-ndjson')
+
+# Longest a GET /jobs/<id>?wait=... long-poll may block
+JOB_MAX_WAIT = 30
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a chart extraction and return its job id immediately"""
+    if 'image' not in request.files:
+        logger.error("No image file in request")
+        return jsonify({"error": "No image file provided"}), 400
+    
+    file = request.files['image']
+    
+    if file.filename == '':
+        logger.error("Empty filename")
+        return jsonify({"error": "No selected file"}), 400
+    
+    if not allowed_file(file.filename):
+        logger.error(f"Invalid file type: {file.filename}")
+        return jsonify({"error": "File type not allowed"}), 400
+    
+    try:
+        profile = request_profile()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        job = job_queue.submit(extract_job, file.filename, read_upload(file), profile)
+    except JobQueueFull as e:
+        logger.warning("Extraction job queue is full, rejecting job")
+        response = jsonify({"error": str(e), "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    
+    logger.info(f"Queued extraction job {job.id}")
+    response = job.to_dict()
+    response["status_url"] = f"/jobs/{job.id}"
+    response["result_url"] = f"/jobs/{job.id}/result"
+    return jsonify(response), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Job status and timings; ?wait=<seconds> long-polls until the job finishes"""
+    try:
+        wait = min(float(request.args.get('wait', 0)), JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    
+    job = job_queue.wait(job_id, wait)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Fetch a finished job's extraction in the same format as /extract"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    if job.status == FAILED:
+        return jsonify({"error": job.error, "job": job.to_dict()}), 500
+    if job.status != DONE:
+        return jsonify(job.to_dict()), 202
+    
+    try:
+        orient = request_orient()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    result = extraction_response(job.result, orient)
+    result["timings"] = job.to_dict()["timings"]
+    return jsonify(result), 200
+
+@app.route('/jobs', methods=['GET'])
+def jobs_stats():
+    """Queue depth and job counts per status"""
+    return jsonify(job_queue.stats()), 200
 
 @app.route('/question', methods=['POST'])
 def question():
@@ -356,8 +736,21 @@ def question():
             logger.error("Table data is missing or too short")
             return jsonify({"error": "Invalid table data. Please extract chart data first."}), 400
         
+        # Numeric questions (max, sum, difference, trend, ...) are answered from the table directly
+        computed = query_engine_answer(request_data)
+        if computed is not None:
+            if request_data.get("stream"):
+                return stream_answer(single_answer(computed.answer), "answer")
+            response_data = {"answer": computed.answer, "answered_by": "query_engine"}
+            if include_debug:
+                response_data["debug_info"] = {
+                    "intent": computed.intent,
+                    "table_data_length": len(table_data)
+                }
+            return jsonify(response_data), 200
+        
         # Check if Ollama is available
-        ollama_running, models = check_ollama_status()
+        ollama_running, models = get_ollama_status()
         if not ollama_running:
             logger.error("Ollama is not available")
             return jsonify({"error": "Ollama is not running. Please start Ollama service."}), 503
@@ -371,11 +764,18 @@ def question():
             
         logger.info(f"Using model: {model}")
         
-        # Get answer from the LLM
-        answer = ask_local_llm(question_text, table_data, title, model)
+        # Repeated questions are served from the answer cache unless the client opts out
+        use_cache = request_data.get("use_cache", True)
+        
+        # Stream tokens as Server-Sent Events if the client asked for it
+        if request_data.get("stream"):
+            return stream_llm_answer(question_text, table_data, title, model, use_cache)
+        
+        # Get answer from the LLM; identical concurrent questions share one generation
+        answer, cached = llm_answer(question_text, table_data, title, model, use_cache)
         logger.info(f"Answer received from LLM: {answer[:100]}...")  # Log first 100 chars
         
-        response_data = {"answer": answer}
+        response_data = {"answer": answer, "answered_by": "llm", "cached": cached}
         
         # Include debug info if requested
         if include_debug:
@@ -387,32 +787,82 @@ def question():
         
         return jsonify(response_data), 200
         
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error processing question: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-def retry_on_failure(max_retries=3, delay=1):
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            last_exception = None
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    last_exception = e
-                    if attempt < max_retries - 1:
-                        logger.warning(f"Attempt {attempt + 1} failed, retrying in {delay} seconds...")
-                        time.sleep(delay)
-            raise last_exception
-        return wrapper
-    return decorator
-
-# Add conversation context tracking
-conversation_contexts = {}
+# Token contexts longer than this are dropped and the session falls back to text history
+SESSION_MAX_CONTEXT_TOKENS = int(os.environ.get('SESSION_MAX_CONTEXT_TOKENS', 4096))
+
+def turn_prompt(session, user_input, model):
+    """
+    Prompt and token context for the next turn of a conversation
+    
+    When the session holds Ollama's context for the same model, only the new
+    message is sent and Ollama continues from its KV state. Otherwise (first
+    turn, model switch, context dropped) the last messages are replayed as text.
+    
+    Returns:
+        tuple: (prompt, context or None)
+    """
+    message = f"User: {user_input}\nAssistant:"
+    context = session['context']
+    if context and session['model'] == model and len(context) <= SESSION_MAX_CONTEXT_TOKENS:
+        return message, context
+    history = "\n".join(session['history'][-5:])  # Keep last 5 messages
+    return f"{history}\n\n{message}", None
+
+def record_turn(session, user_input, response, model, meta):
+    """Append a finished exchange to the session and keep Ollama's new context"""
+    session['history'].append(f"User: {user_input}")
+    session['history'].append(f"Assistant: {response}")
+    
+    # Limit context size
+    if len(session['history']) > 10:  # Keep last 5 exchanges
+        session['history'] = session['history'][-10:]
+    session['context'] = meta.get('context')
+    session['model'] = model
+
+def context_rejected(context, meta):
+    """
+    Whether a turn sent with a stored token context failed because Ollama rejected it
+    
+    Only HTTP error statuses count; timeouts, connection errors and an unknown
+    model (404) would fail the same way without the context.
+    """
+    status = meta.get('status_code')
+    return bool(context) and status is not None and status >= 400 and status != 404
+
+def stream_turn(session_id, user_input, model):
+    """
+    Token generator for a streamed conversation turn
+    
+    The session lock is taken when streaming starts and released when the
+    stream finishes or the client disconnects, so the whole turn is ordered
+    against other requests in the same session. If a stream sent with a
+    stored context fails, the context is dropped so the next turn replays the
+    text history instead of failing the same way.
+    """
+    with session_store.lock(session_id):
+        session = session_store.load(session_id)
+        question, context = turn_prompt(session, user_input, model)
+        meta = {}
+        parts = []
+        try:
+            for token in stream_reply(build_prompt(question, "", "User Input"), model, context, meta):
+                parts.append(token)
+                yield token
+        except LLMStreamError:
+            if context:
+                session['context'] = None
+                session_store.save(session_id, session)
+            raise
+        record_turn(session, user_input, "".join(parts), model, meta)
+        session_store.save(session_id, session)
 
 @app.route('/api/generate', methods=['POST'])
-@retry_on_failure(max_retries=3, delay=2)
 def generate():
     """Endpoint to generate data using Ollama"""
     try:
@@ -420,49 +870,61 @@ def generate():
         if not data or 'input' not in data:
             return jsonify({"error": "Missing input data"}), 400
 
-        # Get or create conversation context
         session_id = data.get('session_id', 'default')
-        if session_id not in conversation_contexts:
-            conversation_contexts[session_id] = []
 
-        # Check if Ollama is available with increased timeout
-        ollama_running, available_models = check_ollama_status()
+        # Check if Ollama is available
+        ollama_running, available_models = get_ollama_status()
         if not ollama_running:
             return jsonify({"error": "Ollama service is not available"}), 503
 
         # Use the first available model if none specified
         model = data.get('model', available_models[0] if available_models else 'llama3')
         
-        # Build context-aware prompt
-        context = "\n".join(conversation_contexts[session_id][-5:])  # Keep last 5 messages
-        prompt = f"{context}\n\nUser: {data['input']}\nAssistant:"
-        
-        # Generate response using Ollama with increased timeout
-        response = ask_local_llm(
-            question=prompt,
-            table_data="",  # Empty for now since we're not processing charts
-            title="User Input",
-            model=model
-        )
+        # Stream tokens as Server-Sent Events if the client asked for it; a failed or
+        # abandoned stream records no turn in the session
+        if data.get('stream'):
+            acquired_at = llm_admission.acquire()
+            response = stream_answer(stream_turn(session_id, data['input'], model), "result")
+            return hold_until_closed(response, llm_admission, acquired_at)
         
-        if isinstance(response, str) and response.startswith("Error:"):
-            return jsonify({"error": response}), 500
+        with session_store.lock(session_id), llm_admission.slot():
+            session = session_store.load(session_id)
             
-        # Update conversation context
-        conversation_contexts[session_id].append(f"User: {data['input']}")
-        conversation_contexts[session_id].append(f"Assistant: {response}")
-        
-        # Limit context size
-        if len(conversation_contexts[session_id]) > 10:  # Keep last 5 exchanges
-            conversation_contexts[session_id] = conversation_contexts[session_id][-10:]
+            # Continue from Ollama's token context when possible, else replay text history
+            question, context = turn_prompt(session, data['input'], model)
+            meta = {}
+            response = generate_reply(build_prompt(question, "", "User Input"), model, context, meta)
+            if context_rejected(context, meta):
+                # Ollama rejected the stored context; retry once from the text history
+                logger.warning(f"Generation with stored context failed, replaying history: {response}")
+                session['context'] = None
+                question, context = turn_prompt(session, data['input'], model)
+                meta = {}
+                response = generate_reply(build_prompt(question, "", "User Input"), model, None, meta)
             
+            if isinstance(response, str) and response.startswith("Error:"):
+                return jsonify({"error": response}), 500
+            
+            record_turn(session, data['input'], response, model, meta)
+            session_store.save(session_id, session)
         return jsonify({"result": response}), 200
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error in generate endpoint: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/session/reset', methods=['POST'])
+def reset_session():
+    """Forget a conversation's history and token context"""
+    data = request.get_json(silent=True) or {}
+    session_id = data.get('session_id', 'default')
+    # Waits for a turn in progress, which would otherwise save the session again afterwards
+    with session_store.lock(session_id):
+        session_store.delete(session_id)
+    return jsonify({"session_id": session_id, "reset": True}), 200
+
 @app.route('/api/analyze-chart', methods=['POST'])
-@retry_on_failure(max_retries=3, delay=2)
 def analyze_chart():
     """Endpoint to analyze a chart image"""
     try:
@@ -477,22 +939,18 @@ def analyze_chart():
         if not allowed_file(file.filename):
             return jsonify({"error": "File type not allowed"}), 400
             
-        # Save the uploaded file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
         # Get model from request or use default
         model = request.form.get('model', 'llama3')
         
-        # Analyze the chart
-        title, headers, data, formatted_table, table_str = extract_table_from_chart(filepath)
-        
-        # Clean up the uploaded file
         try:
-            os.remove(filepath)
-        except:
-            pass
+            profile = request_profile()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Serve repeated uploads from the extraction cache
+        extraction = extract_uploaded_chart(file, profile)
+        
+        title, headers, data, formatted_table, table_str = extraction
             
         return jsonify({
             "title": title,
@@ -502,12 +960,15 @@ def analyze_chart():
             "table_str": table_str
         }), 200
         
+    except ImageTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error analyzing chart: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/ask-chart', methods=['POST'])
-@retry_on_failure(max_retries=3, delay=2)
 def ask_chart():
     """Endpoint to ask questions about chart data"""
     try:
@@ -515,22 +976,132 @@ def ask_chart():
         if not data or not all(k in data for k in ['question', 'table_data', 'title']):
             return jsonify({"error": "Missing required fields"}), 400
             
+        # Numeric questions are answered from the table directly
+        computed = query_engine_answer(data)
+        if computed is not None:
+            if data.get('stream'):
+                return stream_answer(single_answer(computed.answer), "answer")
+            return jsonify({"answer": computed.answer, "answered_by": "query_engine"}), 200
+        
         # Get model from request or use default
         model = data.get('model', 'llama3')
         
-        # Ask the question
-        answer = ask_local_llm(
-            question=data['question'],
-            table_data=data['table_data'],
-            title=data['title'],
-            model=model
-        )
+        use_cache = data.get('use_cache', True)
         
-        return jsonify({"answer": answer}), 200
+        # Stream tokens as Server-Sent Events if the client asked for it
+        if data.get('stream'):
+            return stream_llm_answer(data['question'], data['table_data'], data['title'], model, use_cache)
         
+        # Ask the question; cached or identical concurrent questions skip the generation
+        answer, cached = llm_answer(data['question'], data['table_data'], data['title'], model, use_cache)
+        
+        return jsonify({"answer": answer, "answered_by": "llm", "cached": cached}), 200
+        
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error asking question: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Token required by /model/reload and /model/unload, sent as "Authorization: Bearer <token>";
+# while it is unset those endpoints are disabled
+MODEL_ADMIN_TOKEN = os.environ.get('MODEL_ADMIN_TOKEN') or None
+
+def model_admin_error():
+    """Error response if the request may not reload or unload the model, else None"""
+    if MODEL_ADMIN_TOKEN is None:
+        return jsonify({"error": "Model management is disabled; set MODEL_ADMIN_TOKEN to enable it"}), 403
+    supplied = request.headers.get('Authorization', '').encode('utf-8')
+    if not hmac.compare_digest(supplied, f"Bearer {MODEL_ADMIN_TOKEN}".encode('utf-8')):
+        return jsonify({"error": "Missing or invalid admin token"}), 401
+    return None
+
+@app.route('/model', methods=['GET'])
+def model_info():
+    """Report which DePlot checkpoint is configured and whether it is loaded"""
+    return jsonify({
+        "model_id": model_registry.model_id,
+        "revision": model_registry.revision,
+        "inference_mode": model_registry.mode,
+        "loaded": model_registry.loaded
+    }), 200
+
+@app.route('/model/reload', methods=['POST'])
+def model_reload():
+    """Reload the DePlot model, optionally switching checkpoint, revision or inference mode"""
+    error = model_admin_error()
+    if error is not None:
+        return error
+    data = request.get_json(silent=True) or {}
+    try:
+        model_registry.reload(data.get('model_id'), data.get('revision'), data.get('inference_mode'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error reloading model: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    return jsonify({
+        "model_id": model_registry.model_id,
+        "revision": model_registry.revision,
+        "inference_mode": model_registry.mode,
+        "loaded": True
+    }), 200
+
+@app.route('/batch-stats', methods=['GET'])
+def batch_stats():
+    """Batch size and queueing delay metrics for the DePlot micro-batcher"""
+    return jsonify(batcher.stats()), 200
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters for the extraction and answer caches"""
+    return jsonify({
+        "extraction": extraction_cache.stats(),
+        "answer": answer_cache.stats()
+    }), 200
+
+@app.route('/ollama-stats', methods=['GET'])
+def ollama_stats():
+    """Connection settings and per-endpoint latency of the shared Ollama client"""
+    return jsonify(ollama.stats()), 200
+
+@app.route('/coalescing-stats', methods=['GET'])
+def coalescing_stats():
+    """Counters for requests that joined an identical in-flight extraction or question"""
+    return jsonify({
+        "extract": extraction_flight.stats(),
+        "question": question_flight.stats(),
+        "question_async": question_async_flight.stats()
+    }), 200
+
+@app.route('/admission-stats', methods=['GET'])
+def admission_stats():
+    """Slot usage, wait queue length and rejections of the LLM and DePlot limiters"""
+    return jsonify({
+        "llm": llm_admission.stats(),
+        "deplot": deplot_admission.stats(),
+        "llm_async": llm_async_admission.stats()
+    }), 200
+
+@app.route('/session-stats', methods=['GET'])
+def session_stats():
+    """Conversation session count, memory use, evictions and hit rate"""
+    return jsonify(session_store.stats()), 200
+
+@app.route('/model/unload', methods=['POST'])
+def model_unload():
+    """Unload the DePlot model to free memory; the next extraction loads it again"""
+    error = model_admin_error()
+    if error is not None:
+        return error
+    model_registry.unload()
+    return jsonify({"loaded": False}), 200
+
 if __name__ == '__main__':
+    # Start polling Ollama, and load and warm DePlot in the background so the first extraction
+    # only pays for inference; /readyz turns 200 once that is done. With debug=True the
+    # reloader parent also runs this block; only the serving child does the work.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        health_monitor.start()
+        startup_monitor.start()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,401 @@
+"""
+ASGI app - Serves /question, /api/ask-chart and /api/generate from an asyncio event loop and
+mounts the Flask app for every other route, so pending LLM calls wait as coroutines while
+DePlot extraction keeps running on worker threads
+
+Usage:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+"""
+
+import time
+import logging
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import (app as flask_app, SECURITY_HEADERS, query_engine_answer, turn_prompt, record_turn,
+                 context_rejected, sse_event)
+from admission import llm_async_admission, Overloaded
+from answer_cache import answer_key, get_cached_answer, cache_answer
+from async_ollama import (async_ollama, ask_local_llm_async, stream_local_llm_async, generate_reply_async,
+                          stream_reply_async, get_ollama_status_async)
+from chart_analyzer import LLMStreamError
+from metrics import http_requests, http_request_seconds, http_in_flight
+from ollama_health import health_monitor
+from prompt_builder import build_prompt
+from session_store import session_store
+from singleflight import question_async_flight, question_key
+from startup import startup_monitor
+
+logger = logging.getLogger(__name__)
+
+# Same CORS policy as the Flask app
+CORS_OPTIONS = {
+    "allow_origins": ["http://localhost:8080", "http://localhost:5173"],
+    "allow_methods": ["GET", "POST", "OPTIONS"],
+    "allow_headers": ["Content-Type", "Accept"],
+    "allow_credentials": True,
+    "max_age": 3600
+}
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+# Metric endpoint labels, matching the Flask view names
+ENDPOINT_NAMES = {'/question': 'question', '/api/ask-chart': 'ask_chart', '/api/generate': 'generate',
+                  '/api/session/reset': 'reset_session'}
+
+
+def json_response(payload, status=200, headers=None):
+    return JSONResponse(payload, status_code=status, headers=dict(SECURITY_HEADERS, **(headers or {})))
+
+
+def overloaded_response(error):
+    """429/503 response with Retry-After for a request that could not be admitted"""
+    logger.warning(str(error))
+    return json_response({"error": str(error), "retry_after": error.retry_after}, error.status,
+                         {'Retry-After': str(error.retry_after)})
+
+
+async def read_json(request):
+    """Parsed JSON body, or None if the body is not JSON (like Flask's request.get_json())"""
+    content_type = request.headers.get('content-type', '').split(';')[0].strip()
+    if not (content_type == 'application/json' or content_type.endswith('+json')):
+        return None
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+class HeldStreamingResponse(StreamingResponse):
+    """StreamingResponse that gives an admission slot back however the response ends"""
+
+    def __init__(self, content, acquired_at, **kwargs):
+        super().__init__(content, **kwargs)
+        self.acquired_at = acquired_at
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await llm_async_admission.release(self.acquired_at)
+
+
+def stream_answer(tokens, result_key, on_complete=None, acquired_at=None):
+    """
+    Relay an async token generator to the client as Server-Sent Events
+
+    Same event format as the Flask app's stream_answer. If the client
+    disconnects the token generator is closed, which cancels the upstream
+    Ollama generation. With acquired_at, the LLM admission slot is released
+    when the response ends. on_complete runs on a worker thread.
+    """
+    async def events():
+        parts = []
+        try:
+            async for token in tokens:
+                parts.append(token)
+                yield sse_event({"token": token})
+        except LLMStreamError as e:
+            yield sse_event({"error": f"Error: {str(e)}"}, event="error")
+            return
+        finally:
+            await tokens.aclose()
+        answer = "".join(parts)
+        if on_complete:
+            await run_in_threadpool(on_complete, answer)
+        yield sse_event({result_key: answer}, event="done")
+
+    headers = dict(SECURITY_HEADERS, **SSE_HEADERS)
+    if acquired_at is None:
+        return StreamingResponse(events(), media_type='text/event-stream', headers=headers)
+    return HeldStreamingResponse(events(), acquired_at, media_type='text/event-stream', headers=headers)
+
+
+async def single_answer(answer):
+    """Token generator yielding a precomputed answer, for stream_answer"""
+    yield answer
+
+
+async def llm_answer(question_text, table_data, title, model, use_cache=True):
+    """
+    Answer a question with the LLM, going through the answer cache
+
+    Identical concurrent questions share one generation. The cache may be
+    backed by SQLite, so it is read and written on worker threads.
+
+    Returns:
+        tuple: (answer, cached)
+    """
+    cache_key = answer_key(question_text, table_data, title, model)
+    if use_cache:
+        answer = await run_in_threadpool(get_cached_answer, cache_key)
+        if answer is not None:
+            logger.info("Answer cache hit")
+            return answer, True
+    answer = await question_async_flight.do(
+        question_key(question_text, table_data, title, model),
+        _ask_and_cache, question_text, table_data, title, model, cache_key
+    )
+    return answer, False
+
+
+async def _ask_and_cache(question_text, table_data, title, model, cache_key):
+    """Ask the LLM within an admission slot and cache a successful answer"""
+    async with llm_async_admission.slot():
+        answer = await ask_local_llm_async(question_text, table_data, title, model)
+    await run_in_threadpool(cache_answer, cache_key, answer)
+    return answer
+
+
+async def stream_llm_answer(question_text, table_data, title, model, use_cache=True):
+    """Stream an LLM answer as Server-Sent Events, replaying cached answers as a single token"""
+    cache_key = answer_key(question_text, table_data, title, model)
+    if use_cache:
+        answer = await run_in_threadpool(get_cached_answer, cache_key)
+        if answer is not None:
+            logger.info("Answer cache hit")
+            return stream_answer(single_answer(answer), "answer")
+    acquired_at = await llm_async_admission.acquire()
+    return stream_answer(
+        stream_local_llm_async(question_text, table_data, title, model), "answer",
+        on_complete=lambda answer: cache_answer(cache_key, answer), acquired_at=acquired_at
+    )
+
+
+async def question(request):
+    """Ask a question about chart data"""
+    request_data = await read_json(request)
+
+    if not request_data or not all(k in request_data for k in ("question", "table_data", "title")):
+        logger.error("Missing required fields in request")
+        return json_response({"error": "Missing required fields"}, 400)
+
+    try:
+        question_text = request_data["question"]
+        table_data = request_data["table_data"]
+        title = request_data["title"]
+        include_debug = request_data.get("include_debug", False)
+
+        logger.info(f"Processing question: '{question_text}'")
+
+        if not table_data or len(table_data) < 10:
+            logger.error("Table data is missing or too short")
+            return json_response({"error": "Invalid table data. Please extract chart data first."}, 400)
+
+        # The query engine uses pandas, so it runs on a worker thread
+        computed = await run_in_threadpool(query_engine_answer, request_data)
+        if computed is not None:
+            if request_data.get("stream"):
+                return stream_answer(single_answer(computed.answer), "answer")
+            response_data = {"answer": computed.answer, "answered_by": "query_engine"}
+            if include_debug:
+                response_data["debug_info"] = {
+                    "intent": computed.intent,
+                    "table_data_length": len(table_data)
+                }
+            return json_response(response_data)
+
+        ollama_running, models = await get_ollama_status_async()
+        if not ollama_running:
+            logger.error("Ollama is not available")
+            return json_response({"error": "Ollama is not running. Please start Ollama service."}, 503)
+
+        model = request_data.get("model", "llama3")
+        if model not in models and models:
+            logger.warning(f"Model {model} not available, using {models[0]} instead")
+            model = models[0]
+
+        use_cache = request_data.get("use_cache", True)
+        if request_data.get("stream"):
+            return await stream_llm_answer(question_text, table_data, title, model, use_cache)
+
+        answer, cached = await llm_answer(question_text, table_data, title, model, use_cache)
+        logger.info(f"Answer received from LLM: {answer[:100]}...")
+
+        response_data = {"answer": answer, "answered_by": "llm", "cached": cached}
+        if include_debug:
+            response_data["debug_info"] = {
+                "model_used": model,
+                "table_data_length": len(table_data),
+                "prompt_used": f"Table data + question about {title}"
+            }
+        return json_response(response_data)
+
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Error processing question: {str(e)}")
+        return json_response({"error": str(e)}, 500)
+
+
+async def ask_chart(request):
+    """Endpoint to ask questions about chart data"""
+    try:
+        data = await read_json(request)
+        if not data or not all(k in data for k in ['question', 'table_data', 'title']):
+            return json_response({"error": "Missing required fields"}, 400)
+
+        computed = await run_in_threadpool(query_engine_answer, data)
+        if computed is not None:
+            if data.get('stream'):
+                return stream_answer(single_answer(computed.answer), "answer")
+            return json_response({"answer": computed.answer, "answered_by": "query_engine"})
+
+        model = data.get('model', 'llama3')
+        use_cache = data.get('use_cache', True)
+        if data.get('stream'):
+            return await stream_llm_answer(data['question'], data['table_data'], data['title'], model, use_cache)
+
+        answer, cached = await llm_answer(data['question'], data['table_data'], data['title'], model, use_cache)
+        return json_response({"answer": answer, "answered_by": "llm", "cached": cached})
+
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Error asking question: {str(e)}")
+        return json_response({"error": str(e)}, 500)
+
+
+async def stream_turn(session_id, user_input, model):
+    """
+    Token generator for a streamed conversation turn, holding the session lock throughout
+
+    A failed stream sent with a stored context drops that context, as in the Flask app.
+    Sessions may be stored in SQLite, so they are loaded and saved on worker threads.
+    """
+    async with session_store.async_lock(session_id):
+        session = await run_in_threadpool(session_store.load, session_id)
+        question_text, context = turn_prompt(session, user_input, model)
+        meta = {}
+        parts = []
+        tokens = stream_reply_async(build_prompt(question_text, "", "User Input"), model, context, meta)
+        try:
+            async for token in tokens:
+                parts.append(token)
+                yield token
+        except LLMStreamError:
+            if context:
+                session['context'] = None
+                await run_in_threadpool(session_store.save, session_id, session)
+            raise
+        finally:
+            await tokens.aclose()
+        record_turn(session, user_input, "".join(parts), model, meta)
+        await run_in_threadpool(session_store.save, session_id, session)
+
+
+async def generate(request):
+    """Endpoint to generate data using Ollama"""
+    try:
+        data = await read_json(request)
+        if not data or 'input' not in data:
+            return json_response({"error": "Missing input data"}, 400)
+
+        session_id = data.get('session_id', 'default')
+
+        ollama_running, available_models = await get_ollama_status_async()
+        if not ollama_running:
+            return json_response({"error": "Ollama service is not available"}, 503)
+
+        model = data.get('model', available_models[0] if available_models else 'llama3')
+
+        if data.get('stream'):
+            acquired_at = await llm_async_admission.acquire()
+            return stream_answer(stream_turn(session_id, data['input'], model), "result", acquired_at=acquired_at)
+
+        async with session_store.async_lock(session_id), llm_async_admission.slot():
+            session = await run_in_threadpool(session_store.load, session_id)
+
+            # Continue from Ollama's token context when possible, else replay text history
+            question_text, context = turn_prompt(session, data['input'], model)
+            meta = {}
+            response = await generate_reply_async(build_prompt(question_text, "", "User Input"), model, context, meta)
+            if context_rejected(context, meta):
+                # Ollama rejected the stored context; retry once from the text history
+                logger.warning(f"Generation with stored context failed, replaying history: {response}")
+                session['context'] = None
+                question_text, context = turn_prompt(session, data['input'], model)
+                meta = {}
+                response = await generate_reply_async(build_prompt(question_text, "", "User Input"), model, None, meta)
+
+            if response.startswith("Error:"):
+                return json_response({"error": response}, 500)
+
+            record_turn(session, data['input'], response, model, meta)
+            await run_in_threadpool(session_store.save, session_id, session)
+        return json_response({"result": response})
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Error in generate endpoint: {str(e)}")
+        return json_response({"error": str(e)}, 500)
+
+
+async def reset_session(request):
+    """Forget a conversation's history and token context"""
+    data = await read_json(request) or {}
+    session_id = data.get('session_id', 'default')
+    # Served here rather than by Flask so it waits on the same lock as the async turns
+    async with session_store.async_lock(session_id):
+        await run_in_threadpool(session_store.delete, session_id)
+    return json_response({"session_id": session_id, "reset": True})
+
+
+class RequestMetrics:
+    """ASGI middleware recording the same HTTP metrics as the Flask request hooks"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        endpoint = ENDPOINT_NAMES.get(scope['path'], 'unmatched')
+        started = time.monotonic()
+
+        async def send_with_metrics(message):
+            if message['type'] == 'http.response.start':
+                http_request_seconds.observe(time.monotonic() - started, endpoint=endpoint)
+                http_requests.inc(endpoint=endpoint, status=str(message['status']))
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            http_in_flight.dec()
+
+
+# The LLM endpoints get their own CORS handling; Flask-CORS already covers the mounted app
+llm_app = Starlette(
+    routes=[
+        Route('/question', question, methods=['POST']),
+        Route('/api/ask-chart', ask_chart, methods=['POST']),
+        Route('/api/generate', generate, methods=['POST']),
+        Route('/api/session/reset', reset_session, methods=['POST']),
+    ],
+    middleware=[Middleware(CORSMiddleware, **CORS_OPTIONS), Middleware(RequestMetrics)]
+)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Start Ollama polling and the DePlot load/warmup; close the async Ollama client on shutdown"""
+    health_monitor.start()
+    startup_monitor.start()
+    yield
+    await async_ollama.aclose()
+
+
+app = Starlette(
+    routes=[Route(path, llm_app) for path in ENDPOINT_NAMES] + [Mount('/', WSGIMiddleware(flask_app))],
+    lifespan=lifespan
+)
@@ -0,0 +1,248 @@
+"""
+Async Ollama client - httpx-based counterparts of ollama_client and of the LLM helpers in
+chart_analyzer, for the ASGI app, where a pending generation waits on the event loop
+instead of holding a thread
+"""
+
+import os
+import json
+import time
+import logging
+
+import httpx
+
+from ollama_client import (OLLAMA_BASE_URL, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT,
+                           OLLAMA_CONNECT_RETRIES, OLLAMA_KEEP_ALIVE)
+from ollama_health import health_monitor, UNKNOWN_STATUS
+from chart_analyzer import LLMStreamError
+from prompt_builder import build_prompt
+from metrics import observe_ollama
+
+logger = logging.getLogger(__name__)
+
+# Connections kept to Ollama; Ollama queues generations beyond its own parallelism anyway
+OLLAMA_ASYNC_MAX_CONNECTIONS = int(os.environ.get('OLLAMA_ASYNC_MAX_CONNECTIONS', 100))
+
+
+class AsyncOllamaClient:
+    """
+    Pooled keep-alive httpx.AsyncClient pointed at Ollama.
+
+    Only failed connection attempts are retried (by the transport), for GETs
+    and generations alike, so a generation is never re-run once Ollama may have
+    started it. The underlying client is created on first use, inside the
+    running event loop. Latency is recorded per endpoint path.
+    """
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, connect_timeout=OLLAMA_CONNECT_TIMEOUT,
+                 read_timeout=OLLAMA_READ_TIMEOUT, max_connections=OLLAMA_ASYNC_MAX_CONNECTIONS,
+                 keep_alive=OLLAMA_KEEP_ALIVE):
+        self.base_url = base_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_connections = max_connections
+        self.keep_alive = keep_alive
+        self._client = None
+        self._latency = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            transport = httpx.AsyncHTTPTransport(retries=OLLAMA_CONNECT_RETRIES, limits=limits)
+            self._client = httpx.AsyncClient(base_url=self.base_url, transport=transport,
+                                             timeout=self._timeout(None))
+        return self._client
+
+    def _timeout(self, read_timeout):
+        read = self.read_timeout if read_timeout is None else read_timeout
+        return httpx.Timeout(read, connect=self.connect_timeout)
+
+    def _payload(self, payload):
+        if self.keep_alive:
+            payload = dict(payload)
+            payload.setdefault('keep_alive', self.keep_alive)
+        return payload
+
+    async def get(self, path, timeout=None):
+        """GET an Ollama endpoint"""
+        start = time.perf_counter()
+        try:
+            return await self.client.get(path, timeout=self._timeout(timeout))
+        finally:
+            self._record(path, start)
+
+    async def list_models(self, timeout=None):
+        """
+        Return the names of the models Ollama has pulled
+
+        Raises:
+            httpx.HTTPError: If Ollama is unreachable or errors
+        """
+        response = await self.get('/api/tags', timeout=timeout)
+        response.raise_for_status()
+        return [model['name'] for model in response.json().get('models', [])]
+
+    async def generate(self, payload, timeout=None):
+        """POST a non-streaming generation request to /api/generate"""
+        start = time.perf_counter()
+        try:
+            return await self.client.post('/api/generate', json=self._payload(payload), timeout=self._timeout(timeout))
+        finally:
+            self._record('/api/generate', start)
+
+    def stream_generate(self, payload, timeout=None):
+        """
+        Streaming generation request, as an async context manager yielding the response
+
+        Leaving the block closes the connection, which makes Ollama abandon the
+        generation. The recorded latency is the time to response headers.
+        """
+        return self.client.stream('POST', '/api/generate', json=self._payload(payload), timeout=self._timeout(timeout))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self):
+        """Per-endpoint call counts and latency in milliseconds"""
+        stats = {path: dict(entry) for path, entry in self._latency.items()}
+        for entry in stats.values():
+            entry['avg_ms'] = round(entry['total_ms'] / entry['calls'], 2) if entry['calls'] else 0.0
+        return {
+            "base_url": self.base_url,
+            "max_connections": self.max_connections,
+            "connect_timeout": self.connect_timeout,
+            "read_timeout": self.read_timeout,
+            "keep_alive": self.keep_alive,
+            "endpoints": stats
+        }
+
+    def _record(self, path, start):
+        # Only called from the event loop thread, so no lock is needed
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        entry = self._latency.setdefault(path, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0})
+        entry['calls'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        entry['last_ms'] = elapsed_ms
+
+
+# Process-wide async client used by the ASGI app
+async_ollama = AsyncOllamaClient()
+
+
+async def ask_local_llm_async(question, table_data="", title="", model="llama3"):
+    """Ask a question to the local LLM using Ollama (async version of ask_local_llm)"""
+    return await generate_reply_async(build_prompt(question, table_data, title), model)
+
+
+async def generate_reply_async(prompt, model="llama3", context=None, meta=None):
+    """
+    Run one non-streaming Ollama generation (async version of generate_reply)
+
+    On an HTTP error status, meta (if given) receives status_code.
+
+    Returns:
+        str: The answer, or a message starting with "Error:"
+    """
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": False
+    }
+    if context:
+        payload["context"] = context
+    try:
+        response = await async_ollama.generate(payload)
+    except httpx.TimeoutException:
+        logger.error("Timeout while waiting for Ollama response")
+        return f"Error: Request timed out after {async_ollama.read_timeout / 60:g} minutes. Please try again with a simpler question or a different model."
+    except httpx.HTTPError as e:
+        logger.error(f"Error communicating with Ollama: {str(e)}")
+        return f"Error: {str(e)}"
+
+    if response.status_code != 200:
+        error_msg = f"Error from Ollama API: {response.status_code} - {response.text}"
+        logger.error(error_msg)
+        if meta is not None:
+            meta['status_code'] = response.status_code
+        return f"Error: {error_msg}"
+    body = response.json()
+    observe_ollama(body)
+    if meta is not None:
+        meta.update({key: value for key, value in body.items() if key != 'response'})
+    return body['response']
+
+
+def stream_local_llm_async(question, table_data="", title="", model="llama3"):
+    """Ask a question to the local LLM and async-yield the answer token by token"""
+    return stream_reply_async(build_prompt(question, table_data, title), model)
+
+
+async def stream_reply_async(prompt, model="llama3", context=None, meta=None):
+    """
+    Run one streaming Ollama generation (async version of stream_reply)
+
+    Yields:
+        str: Answer fragments as Ollama produces them
+
+    Raises:
+        LLMStreamError: If Ollama cannot be reached or reports an error
+    """
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True
+    }
+    if context:
+        payload["context"] = context
+    start = time.perf_counter()
+    try:
+        async with async_ollama.stream_generate(payload) as response:
+            async_ollama._record('/api/generate', start)
+            if response.status_code != 200:
+                text = (await response.aread()).decode('utf-8', 'replace')
+                error_msg = f"Error from Ollama API: {response.status_code} - {text}"
+                logger.error(error_msg)
+                raise LLMStreamError(error_msg)
+
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    raise LLMStreamError(chunk['error'])
+                if chunk.get('response'):
+                    yield chunk['response']
+                if chunk.get('done'):
+                    observe_ollama(chunk)
+                    if meta is not None:
+                        meta.update({key: value for key, value in chunk.items() if key != 'response'})
+                    break
+    except httpx.HTTPError as e:
+        logger.error(f"Error communicating with Ollama: {str(e)}")
+        raise LLMStreamError(str(e))
+
+
+async def check_ollama_status_async():
+    """Check if Ollama is running and get available models (async version of check_ollama_status)"""
+    try:
+        return True, await async_ollama.list_models(timeout=30)
+    except httpx.HTTPError as e:
+        logger.error(f"Error checking Ollama status: {str(e)}")
+        return False, []
+
+
+async def get_ollama_status_async():
+    """
+    Return (available, models) from the health monitor's latest snapshot
+
+    Until the monitor's first probe has finished, Ollama is probed directly
+    (without blocking the event loop) instead.
+    """
+    status = health_monitor.latest()
+    if status is UNKNOWN_STATUS:
+        return await check_ollama_status_async()
+    return status.available, list(status.models)
@@ -0,0 +1,233 @@
+"""
+Micro-batching engine - Groups concurrent chart extractions into a single padded
+DePlot generate call so that CPU matmul throughput is not wasted on batch size 1
+"""
+
+import os
+import queue
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future
+
+from model_registry import DEPLOT_PROMPT, registry
+from generation import resolve_profile, generate_kwargs, trim_stopped_outputs, count_generated_tokens
+from metrics import extraction_stage_seconds
+
+logger = logging.getLogger(__name__)
+
+# Batching configuration, overridable through the environment
+MAX_BATCH_SIZE = int(os.environ.get('DEPLOT_BATCH_MAX_SIZE', 8))
+BATCH_WINDOW_MS = float(os.environ.get('DEPLOT_BATCH_WINDOW_MS', 25))
+
+
+class _PendingImage:
+    """An image waiting in the batch queue together with its caller's future"""
+
+    __slots__ = ('image', 'profile', 'future', 'enqueued_at', 'timings')
+
+    def __init__(self, image, profile, timings):
+        self.image = image
+        self.profile = profile
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.timings = timings
+
+
+class MicroBatcher:
+    """
+    Collects images submitted from many request threads and decodes them together.
+
+    A single worker thread waits for the first pending image, then keeps gathering
+    more until either max_batch_size images are queued or window_ms has elapsed
+    since the first one arrived. The batch is run through the processor and
+    generate once and each caller's future receives its own decoded string.
+    Only images sharing a generation profile are batched together; others are
+    held back for the next batch.
+    """
+
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, window_ms=BATCH_WINDOW_MS):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._deferred = deque()  # Only touched by the worker thread
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'batches': 0,
+            'images': 0,
+            'errors': 0,
+            'batch_size_histogram': {},
+            'queue_delay_total_ms': 0.0,
+            'queue_delay_max_ms': 0.0,
+            'generate_total_ms': 0.0,
+            'tokens_total': 0,
+            'tokens_max': 0,
+            'under_budget': 0,
+            'profiles': {},
+        }
+
+    def submit(self, image, timings=None, profile=None):
+        """
+        Queue an image for decoding
+
+        Args:
+            image (PIL.Image.Image): Chart image
+            timings (dict): Optional dict that receives batch_wait_ms, preprocess_ms,
+                generate_ms, batch_size and tokens for this image
+            profile (str): Generation profile name; the default profile if None
+
+        Returns:
+            concurrent.futures.Future: Resolves to the raw DePlot output string
+
+        Raises:
+            ValueError: If the profile is unknown
+        """
+        profile, _ = resolve_profile(profile)
+        self._ensure_worker()
+        pending = _PendingImage(image, profile, timings)
+        self._queue.put(pending)
+        return pending.future
+
+    def generate(self, image, timings=None, profile=None):
+        """Decode a single image through the batch queue and wait for the result"""
+        return self.submit(image, timings, profile).result()
+
+    def stats(self):
+        """Return a snapshot of batch size and queueing delay metrics"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats['batch_size_histogram'] = dict(self._stats['batch_size_histogram'])
+            stats['profiles'] = {name: dict(counts) for name, counts in self._stats['profiles'].items()}
+        images = stats['images']
+        batches = stats['batches']
+        stats['avg_batch_size'] = round(images / batches, 2) if batches else 0.0
+        stats['avg_queue_delay_ms'] = round(stats['queue_delay_total_ms'] / images, 2) if images else 0.0
+        stats['avg_generate_ms'] = round(stats['generate_total_ms'] / batches, 2) if batches else 0.0
+        stats['avg_tokens'] = round(stats['tokens_total'] / images, 1) if images else 0.0
+        stats['profiles'] = {name: dict(counts) for name, counts in stats['profiles'].items()}
+        stats['queue_depth'] = self._queue.qsize()
+        stats['max_batch_size'] = self.max_batch_size
+        stats['window_ms'] = self.window * 1000.0
+        return stats
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='deplot-batcher', daemon=True)
+                self._worker.start()
+
+    def _next(self, timeout=None):
+        """Next pending image, taking held-back ones first"""
+        if self._deferred:
+            return self._deferred.popleft()
+        if timeout is None:
+            return self._queue.get()
+        if timeout <= 0:
+            return self._queue.get_nowait()
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        """Block for the first pending image, then gather more until the window closes"""
+        batch = [self._next()]
+        profile = batch[0].profile
+        deadline = batch[0].enqueued_at + self.window
+        held_back = []
+        while len(batch) < self.max_batch_size:
+            # Once the window closes, still take whatever is already waiting
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._next(max(remaining, 0))
+            except queue.Empty:
+                break
+            if item.profile == profile:
+                batch.append(item)
+            else:
+                held_back.append(item)
+                if len(held_back) >= self.max_batch_size:
+                    break
+        # Keep held-back images in arrival order ahead of anything newer
+        self._deferred.extendleft(reversed(held_back))
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Skip callers that gave up (cancelled futures) before we started
+            batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.monotonic()
+            stage_timings = {}
+            try:
+                outputs, tokens = self._generate_batch([item.image for item in batch], batch[0].profile, stage_timings)
+            except Exception as e:
+                logger.error(f"Batched DePlot generation failed: {str(e)}")
+                with self._stats_lock:
+                    self._stats['errors'] += 1
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+            finished = time.monotonic()
+            self._record(batch, started, finished, tokens)
+            for item in batch:
+                extraction_stage_seconds.observe(started - item.enqueued_at, stage='batch_wait')
+            for item, token_count in zip(batch, tokens):
+                if item.timings is not None:
+                    item.timings['batch_wait_ms'] = (started - item.enqueued_at) * 1000.0
+                    item.timings['batch_size'] = len(batch)
+                    item.timings['tokens'] = token_count
+                    item.timings.update(stage_timings)
+            for item, output in zip(batch, outputs):
+                item.future.set_result(output)
+
+    def _generate_batch(self, images, profile, timings):
+        """Run one padded generate call; returns (decoded outputs, generated token counts)"""
+        # Model and mode from one snapshot, so a concurrent reload cannot mix them
+        processor, model, mode = registry.current()
+        _, settings = resolve_profile(profile)
+        start = time.monotonic()
+        inputs = processor(images=images, text=[DEPLOT_PROMPT] * len(images), return_tensors="pt")
+        preprocessed = time.monotonic()
+        kwargs = generate_kwargs(settings, processor)
+        with registry.inference_context(mode):
+            predictions = model.generate(**inputs, **kwargs)
+        outputs = processor.batch_decode(predictions, skip_special_tokens=True)
+        tokens = count_generated_tokens(predictions, processor.tokenizer.pad_token_id)
+        # Only sequences the criterion ended carry the extra row that triggered the stop
+        outputs = trim_stopped_outputs(outputs, kwargs)
+        generated = time.monotonic()
+        extraction_stage_seconds.observe(preprocessed - start, stage='preprocess')
+        extraction_stage_seconds.observe(generated - preprocessed, stage='generate')
+        timings['preprocess_ms'] = (preprocessed - start) * 1000.0
+        timings['generate_ms'] = (generated - preprocessed) * 1000.0
+        return outputs, tokens
+
+    def _record(self, batch, started, finished, tokens):
+        size = len(batch)
+        profile = batch[0].profile
+        max_new_tokens = resolve_profile(profile)[1]['max_new_tokens']
+        delays = [(started - item.enqueued_at) * 1000.0 for item in batch]
+        logger.debug(f"DePlot batch of {size} ({profile}) decoded in {(finished - started) * 1000.0:.0f}ms, tokens={tokens}")
+        with self._stats_lock:
+            stats = self._stats
+            stats['batches'] += 1
+            stats['images'] += size
+            stats['batch_size_histogram'][size] = stats['batch_size_histogram'].get(size, 0) + 1
+            stats['queue_delay_total_ms'] += sum(delays)
+            stats['queue_delay_max_ms'] = max(stats['queue_delay_max_ms'], max(delays))
+            stats['generate_total_ms'] += (finished - started) * 1000.0
+            stats['tokens_total'] += sum(tokens)
+            stats['tokens_max'] = max(stats['tokens_max'], max(tokens))
+            stats['under_budget'] += sum(1 for count in tokens if count < max_new_tokens)
+            profile_stats = stats['profiles'].setdefault(profile, {'images': 0, 'tokens': 0})
+            profile_stats['images'] += size
+            profile_stats['tokens'] += sum(tokens)
+
+
+# Process-wide batcher in front of the shared DePlot model
+batcher = MicroBatcher()
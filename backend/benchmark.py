@@ -0,0 +1,305 @@
+"""
+Benchmark - Offline load test of /extract, /question and /api/generate
+
+Starts a fake Ollama server and the Flask app (with the tiny random DePlot model unless
+told otherwise), drives each endpoint from a pool of concurrent clients and reports
+throughput and p50/p95/p99 latency. The JSON report can be diffed against a report
+from another commit with --compare.
+
+Usage:
+    python benchmark.py [--scenarios extract question generate] [--concurrency 4] [--requests 50]
+                        [--cache-mode cold|warm] [--json report.json] [--compare baseline.json]
+    python benchmark.py --url http://localhost:5000 ...   # against an already running server
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import socket
+import platform
+import argparse
+import subprocess
+import threading
+import logging
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image, ImageDraw
+from tabulate import tabulate
+
+from fake_ollama import start_fake_ollama, add_config_arguments, config_from_args
+from tiny_model import TINY_MODEL_ID
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ('extract', 'question', 'generate')
+CACHE_MODES = ('cold', 'warm')
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Server stats captured after each scenario, so reports show batching/cache/admission behaviour
+STATS_ENDPOINTS = ('/batch-stats', '/cache-stats', '/admission-stats', '/coalescing-stats')
+
+TABLE_DATA = ("Year | Sales | Profit\n2019 | 120 | 14\n2020 | 98 | 9\n"
+              "2021 | 143 | 21\n2022 | 171 | 26\n2023 | 160 | 22")
+TITLE = "Annual sales and profit"
+
+
+def percentile(sorted_values, q):
+    """Linear-interpolated percentile (q in 0-100) of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def synthetic_chart(seed, size=(480, 320)):
+    """A simple bar chart PNG; different seeds give different bars (and cache keys)"""
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    bars = 5
+    slot = (width - 60) // bars
+    draw.line([(40, 20), (40, height - 30), (width - 10, height - 30)], fill='black', width=2)
+    for i in range(bars):
+        bar_height = rng.randint(20, height - 60)
+        left = 50 + i * slot
+        draw.rectangle([left, height - 30 - bar_height, left + slot - 15, height - 31], fill=(70, 110 + 20 * i, 180))
+        draw.text((left, height - 25), str(2019 + i), fill='black')
+        draw.text((left, height - 45 - bar_height), str(bar_height), fill='black')
+    draw.text((width // 3, 4), f"Chart {seed}", fill='black')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def make_request(scenario, index, cache_mode, sessions):
+    """
+    Build the keyword arguments for one requests.post call
+
+    In cold mode every request carries a distinct image or question and opts out of
+    the answer cache; in warm mode every request is identical, so caches and
+    request coalescing are exercised instead of the models.
+    """
+    key = index if cache_mode == 'cold' else 0
+    if scenario == 'extract':
+        return {'files': {'image': (f'chart-{key}.png', synthetic_chart(key), 'image/png')}}
+    if scenario == 'question':
+        return {'json': {
+            "question": f"What does chart {key} suggest about the business?",
+            "table_data": TABLE_DATA,
+            "title": TITLE,
+            "use_query_engine": False,
+            "use_cache": cache_mode == 'warm'
+        }}
+    return {'json': {"input": f"Summarize point {key} in one sentence.", "session_id": f"bench-{index % sessions}"}}
+
+
+ENDPOINTS = {'extract': '/extract', 'question': '/question', 'generate': '/api/generate'}
+
+
+def run_scenario(base_url, scenario, concurrency, total, warmup, cache_mode, sessions, timeout):
+    """
+    Send `total` requests from `concurrency` client threads and summarize them
+
+    The first `warmup` requests are sent (sequentially) but not counted.
+
+    Returns:
+        dict: Counts, throughput and latency percentiles in ms
+    """
+    url = base_url + ENDPOINTS[scenario]
+    local = threading.local()
+
+    def send(index):
+        # One keep-alive session per client thread
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        kwargs = make_request(scenario, index, cache_mode, sessions)
+        start = time.perf_counter()
+        try:
+            response = session.post(url, timeout=timeout, **kwargs)
+            status = response.status_code
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"{scenario} request {index} failed: {str(e)}")
+            status = 'error'
+        return status, (time.perf_counter() - start) * 1000.0
+
+    for index in range(warmup):
+        send(-1 - index)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for status, latency in results if status == 200)
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "scenario": scenario,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": total - len(latencies),
+        "statuses": statuses,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(latencies[-1], 1) if latencies else 0.0
+    }
+
+
+def server_stats(base_url):
+    """Snapshot of the server's own stats endpoints; unavailable ones are skipped"""
+    stats = {}
+    for path in STATS_ENDPOINTS:
+        try:
+            response = requests.get(base_url + path, timeout=5)
+            if response.status_code == 200:
+                stats[path.strip('/')] = response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+    return stats
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(ollama_url, model_id, ready_timeout):
+    """
+    Run the Flask app in a subprocess pointed at the fake Ollama server and wait for /readyz
+
+    Returns:
+        tuple: (Popen, base URL)
+    """
+    port = free_port()
+    env = dict(os.environ, OLLAMA_BASE_URL=ollama_url, DEPLOT_MODEL_ID=model_id, DEPLOT_TINY='0')
+    command = [sys.executable, '-c',
+               f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+
+    # /readyz starts the model load and warmup on first call and returns 200 once done
+    deadline = time.monotonic() + ready_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Flask app exited with code {process.returncode} during startup")
+        try:
+            if requests.get(base_url + '/readyz', timeout=2).status_code == 200:
+                return process, base_url
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"Flask app not ready after {ready_timeout:g}s")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_reports(report, baseline):
+    """Per-scenario rows of baseline -> current values with the relative change"""
+    previous = {result['scenario']: result for result in baseline.get('results', [])}
+    rows = []
+    for result in report['results']:
+        old = previous.get(result['scenario'])
+        if old is None:
+            continue
+        row = {"scenario": result['scenario']}
+        for field in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            change = (result[field] - old[field]) / old[field] * 100.0 if old[field] else 0.0
+            row[field] = f"{old[field]:g} -> {result[field]:g} ({change:+.1f}%)"
+        row["errors"] = f"{old['errors']} -> {result['errors']}"
+        rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test of the extraction and LLM endpoints")
+    parser.add_argument('--url', help="Benchmark an already running server instead of starting one")
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument('--concurrency', type=int, default=4, help="Concurrent client threads")
+    parser.add_argument('--requests', type=int, default=50, help="Timed requests per scenario")
+    parser.add_argument('--warmup', type=int, default=2, help="Untimed requests before each scenario")
+    parser.add_argument('--cache-mode', default='cold', choices=CACHE_MODES,
+                        help="cold: distinct inputs, answer cache off; warm: identical inputs")
+    parser.add_argument('--sessions', type=int, default=0, help="Conversation sessions for generate (default: concurrency)")
+    parser.add_argument('--timeout', type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument('--model-id', default=TINY_MODEL_ID,
+                        help=f"DePlot checkpoint for the started app (default: {TINY_MODEL_ID})")
+    parser.add_argument('--ready-timeout', type=float, default=600.0)
+    parser.add_argument('--json', help="Also write the report as JSON to this path")
+    parser.add_argument('--compare', help="Baseline JSON report to diff against")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    fake_ollama, process = None, None
+    base_url = args.url.rstrip('/') if args.url else None
+    try:
+        if base_url is None:
+            fake_ollama = start_fake_ollama(config_from_args(args))
+            process, base_url = start_app(fake_ollama.url, args.model_id, args.ready_timeout)
+
+        results, stats = [], {}
+        for scenario in args.scenarios:
+            logger.info(f"Running {scenario}: {args.requests} requests, concurrency {args.concurrency}, {args.cache_mode} caches")
+            results.append(run_scenario(base_url, scenario, args.concurrency, args.requests, args.warmup,
+                                        args.cache_mode, args.sessions or args.concurrency, args.timeout))
+            stats[scenario] = server_stats(base_url)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if fake_ollama is not None:
+            fake_ollama.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "platform": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "settings": {
+            "url": args.url,
+            "model_id": None if args.url else args.model_id,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "cache_mode": args.cache_mode
+        },
+        "fake_ollama": fake_ollama.ollama.config.to_dict() if fake_ollama is not None else None,
+        "results": results,
+        "server_stats": stats
+    }
+
+    print(tabulate([{key: value for key, value in result.items() if key != 'statuses'} for result in results],
+                   headers="keys", tablefmt="grid"))
+    if args.compare:
+        with open(args.compare) as f:
+            rows = compare_reports(report, json.load(f))
+        print(tabulate(rows, headers="keys", tablefmt="grid") if rows else "No matching scenarios in the baseline")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if all(result['errors'] == 0 for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Bulk chart extraction - Extracts tables from many chart images (directories, zip archives
+or uploaded files) and streams one JSON Lines record per image
+
+Usage:
+    python bulk.py charts/ archive.zip --output results.jsonl [--resume] [--workers 16]
+"""
+
+import os
+import sys
+import json
+import time
+import zipfile
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from chart_analyzer import extract_table_from_chart
+from admission import deplot_admission
+from extraction_cache import image_hash, extraction_key, get_cached_extraction, cache_extraction
+from batching import batcher
+from generation import GENERATION_PROFILES
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+# Enough decode threads to keep the batcher supplied with full batches
+DEFAULT_WORKERS = max(4, 2 * batcher.max_batch_size)
+
+# Largest zip member read into memory, the same as the upload limit for a single image
+MAX_MEMBER_BYTES = int(os.environ.get('BULK_MAX_MEMBER_BYTES', 16 * 1024 * 1024))
+
+
+def is_image_name(name):
+    return '.' in name and name.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+
+def iter_zip(archive, prefix=""):
+    """
+    Yield (name, loader) for every chart image in a zip archive
+
+    Members are read here, in the consuming thread, because ZipFile is not safe
+    to read from several threads and the archive closes once iteration ends.
+    Members larger than MAX_MEMBER_BYTES are not read; their loader raises
+    instead, so they show up as error records.
+
+    Args:
+        archive: Path or file-like object of the zip file
+        prefix (str): Prepended to member names so records stay unique across archives
+    """
+    with zipfile.ZipFile(archive) as zf:
+        for member in zf.infolist():
+            if member.is_dir() or not is_image_name(member.filename):
+                continue
+            # zipfile never returns more than the declared size, so this bounds the read
+            if member.file_size > MAX_MEMBER_BYTES:
+                logger.warning(f"Skipping {prefix + member.filename}: {member.file_size} bytes uncompressed")
+                yield prefix + member.filename, _too_large(member.file_size)
+                continue
+            data = zf.read(member)
+            yield prefix + member.filename, (lambda d=data: d)
+
+
+def _too_large(size):
+    def loader():
+        raise ValueError(f"Archive member is {size} bytes uncompressed, over the {MAX_MEMBER_BYTES} byte limit")
+    return loader
+
+
+def iter_sources(paths):
+    """
+    Yield (name, loader) for every chart image under the given paths
+
+    Directories are walked recursively in sorted order and .zip files are read
+    member by member. The loader returns the image bytes when called, so bytes
+    are only read once a worker picks the image up.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for filename in sorted(files):
+                    full_path = os.path.join(root, filename)
+                    if filename.lower().endswith('.zip'):
+                        yield from iter_zip(full_path, prefix=full_path + "!")
+                    elif is_image_name(filename):
+                        yield full_path, (lambda p=full_path: _read_file(p))
+        elif path.lower().endswith('.zip'):
+            yield from iter_zip(path, prefix=path + "!")
+        elif is_image_name(path):
+            yield path, (lambda p=path: _read_file(p))
+        else:
+            logger.warning(f"Skipping {path}: not a directory, zip archive or chart image")
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def extract_record(name, image_bytes, profile=None):
+    """
+    Extract one image and return its JSON Lines record
+
+    Images whose hash is already in the extraction cache are not decoded again.
+    A decode holds a DePlot admission slot, waiting for one rather than failing,
+    so bulk work shares DEPLOT_MAX_CONCURRENCY with the other extractions.
+    """
+    start = time.monotonic()
+    digest = image_hash(image_bytes)
+    record = {"file": name, "sha256": digest}
+    try:
+        key = extraction_key(digest, profile)
+        extraction = get_cached_extraction(key)
+        record["cached"] = extraction is not None
+        if extraction is None:
+            with deplot_admission.slot(bounded=False):
+                extraction = extract_table_from_chart(image_bytes, profile=profile)
+            cache_extraction(key, extraction)
+        record.update({"title": extraction.title, "headers": extraction.headers,
+                       "rows": extraction.data, "raw_text": extraction.raw_output})
+    except Exception as e:
+        logger.error(f"Bulk extraction failed for {name}: {str(e)}")
+        record["error"] = str(e)
+    record["elapsed_ms"] = round((time.monotonic() - start) * 1000.0, 1)
+    return record
+
+
+def extract_many(sources, workers=DEFAULT_WORKERS, skip=None, profile=None):
+    """
+    Extract every (name, loader) pair, yielding records as they complete
+
+    Reading and decoding run on a thread pool while inference is batched by the
+    shared micro-batcher. At most 2 * workers images are held in memory at once.
+
+    Args:
+        sources (iterable): (name, loader) pairs, e.g. from iter_sources
+        workers (int): Number of read/decode threads
+        skip (set): Names to leave out, e.g. already present in a resumed output file
+        profile (str): Generation profile name; the default profile if None
+
+    Yields:
+        dict: One record per image, then a final {"summary": {...}} record
+    """
+    skip = skip or set()
+    started = time.monotonic()
+    counts = {"images": 0, "cached": 0, "errors": 0, "skipped": 0}
+
+    def run(name, loader):
+        try:
+            image_bytes = loader()
+        except Exception as e:
+            return {"file": name, "error": f"Could not read image: {str(e)}"}
+        return extract_record(name, image_bytes, profile)
+
+    def tally(record):
+        counts["images"] += 1
+        if record.get("cached"):
+            counts["cached"] += 1
+        if "error" in record:
+            counts["errors"] += 1
+        return record
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk-extract') as executor:
+        pending = set()
+        for name, loader in sources:
+            if name in skip:
+                counts["skipped"] += 1
+                continue
+            pending.add(executor.submit(run, name, loader))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield tally(future.result())
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield tally(future.result())
+
+    elapsed = time.monotonic() - started
+    counts["elapsed_s"] = round(elapsed, 2)
+    counts["images_per_second"] = round(counts["images"] / elapsed, 3) if elapsed > 0 else 0.0
+    yield {"summary": counts}
+
+
+def completed_names(output_path):
+    """Names already extracted without error in an existing JSON Lines output file"""
+    names = set()
+    if not os.path.exists(output_path):
+        return names
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line truncated by an interrupted run
+                continue
+            if "file" in record and "error" not in record:
+                names.add(record["file"])
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract tables from many chart images as JSON Lines")
+    parser.add_argument('paths', nargs='+', help="Chart images, directories or zip archives")
+    parser.add_argument('--output', '-o', help="JSON Lines output file (default: stdout)")
+    parser.add_argument('--resume', action='store_true', help="Skip images already present in --output")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Read/decode threads")
+    parser.add_argument('--profile', choices=sorted(GENERATION_PROFILES), help="Generation profile")
+    args = parser.parse_args(argv)
+
+    skip = set()
+    if args.resume:
+        if not args.output:
+            parser.error("--resume requires --output")
+        skip = completed_names(args.output)
+        logger.info(f"Resuming: {len(skip)} images already extracted")
+
+    out = open(args.output, 'a' if args.resume else 'w') if args.output else sys.stdout
+    if args.resume and out.tell() > 0:
+        # Terminate a line that an interrupted run may have left half-written
+        out.write("\n")
+    try:
+        for record in extract_many(iter_sources(args.paths), workers=args.workers, skip=skip, profile=args.profile):
+            if "summary" in record:
+                summary = record["summary"]
+                logger.info(
+                    f"Extracted {summary['images']} images ({summary['cached']} cached, "
+                    f"{summary['errors']} errors, {summary['skipped']} skipped) "
+                    f"in {summary['elapsed_s']}s - {summary['images_per_second']} images/s"
+                )
+                continue
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
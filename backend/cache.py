@@ -0,0 +1,199 @@
+"""
+Cache module - Small two-tier cache (in-memory LRU with TTL, optional SQLite on disk)
+used to avoid recomputing chart extractions
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Returned by get() on a miss so that falsy values can still be cached
+MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with a per-entry time to live"""
+
+    def __init__(self, max_entries=256, ttl=3600):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                self.evictions += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def values(self):
+        """Snapshot of the live values, least recently used first"""
+        now = time.time()
+        with self._lock:
+            return [value for value, expires_at in self._entries.values() if expires_at is None or expires_at > now]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """JSON values stored in a SQLite table so they survive restarts"""
+
+    def __init__(self, path, table='cache', ttl=None):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # A SQLite connection must not be used across fork(); forked workers open their own
+        os.register_at_fork(after_in_child=self._reconnect)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def _reconnect(self):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return MISSING
+        value, created_at = row
+        if self.ttl and created_at + self.ttl <= time.time():
+            self.delete(key)
+            return MISSING
+        return json.loads(value)
+
+    def set(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time())
+            )
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def purge_expired(self):
+        """Delete entries older than the TTL; returns how many were removed"""
+        if not self.ttl:
+            return 0
+        with self._lock, self._conn:
+            cursor = self._conn.execute(f"DELETE FROM {self.table} WHERE created_at <= ?", (time.time() - self.ttl,))
+        return cursor.rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class TieredCache:
+    """
+    In-memory LRU in front of an optional SQLite tier.
+
+    Disk hits are promoted into memory. Values written to the disk tier must be
+    JSON-serializable (tuples come back as lists).
+    """
+
+    def __init__(self, name, max_entries=256, ttl=3600, db_path=None):
+        self.name = name
+        self.memory = LRUCache(max_entries, ttl)
+        self.disk = None
+        if db_path:
+            try:
+                self.disk = SQLiteCache(db_path, table=name, ttl=ttl)
+            except sqlite3.Error as e:
+                logger.warning(f"Disk tier for cache '{name}' disabled: {str(e)}")
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'sets': 0}
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not MISSING:
+            self._count('hits', 'memory_hits')
+            return value
+        if self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"Disk read failed for cache '{self.name}': {str(e)}")
+                value = MISSING
+            if value is not MISSING:
+                self.memory.set(key, value)
+                self._count('hits', 'disk_hits')
+                return value
+        self._count('misses')
+        return MISSING
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.warning(f"Disk write failed for cache '{self.name}': {str(e)}")
+        self._count('sets')
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        """Return hit/miss counters and tier sizes"""
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['memory_entries'] = len(self.memory)
+        stats['memory_evictions'] = self.memory.evictions
+        stats['disk_enabled'] = self.disk is not None
+        return stats
+
+    def _count(self, *names):
+        with self._lock:
+            for name in names:
+                self._counters[name] += 1
@@ -4,16 +4,22 @@ Chart Analyzer module - Extracts tabular data from chart images and processes qu
 using a locally running LLM via Ollama
 """
 
-from transformers import Pix2StructProcessor, Pix2StructForConditionalGeneration
 from PIL import Image
-from tabulate import tabulate
-import pandas as pd
 import requests
+import io
+import os
 import json
 import signal
 import sys
 import time
 import logging
+import warnings
+
+from batching import batcher
+from ollama_client import ollama
+from table import ChartTable
+from prompt_builder import build_prompt
+from metrics import extraction_stage_seconds, observe_ollama
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -35,33 +41,121 @@ def signal_handler(sig, frame):
 # Register the signal handler for Ctrl+C
 signal.signal(signal.SIGINT, signal_handler)
 
-def extract_table_from_chart(image_path):
+# Uploads larger than this are rejected before their pixels are decoded
+MAX_IMAGE_SIDE = int(os.environ.get('DEPLOT_MAX_IMAGE_SIDE', 12000))
+MAX_IMAGE_PIXELS = int(os.environ.get('DEPLOT_MAX_IMAGE_PIXELS', 50_000_000))
+
+# JPEGs are downscaled during decode (by powers of two) towards this size; DePlot's
+# patch budget covers far fewer pixels, so the extra resolution is wasted work
+DRAFT_SIZE = (2048, 2048)
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an image's dimensions exceed MAX_IMAGE_SIDE or MAX_IMAGE_PIXELS"""
+
+
+# Pillow only warns between its own pixel limit and twice that; raise instead, so load_image
+# reports every decompression bomb as ImageTooLargeError (set once here, filters are process-wide)
+warnings.simplefilter('error', Image.DecompressionBombWarning)
+
+
+def load_image(source):
+    """
+    Open and decode a chart image from a path, bytes, a file-like object or a PIL image
+    
+    Only the header is read before the size check, so oversized images are
+    rejected without decoding them. JPEGs are decoded in draft mode at reduced size.
+    Images that trip Pillow's own decompression bomb check are rejected the same way.
+    
+    Args:
+        source: File path (str), raw bytes, binary file-like object or PIL.Image.Image
+        
+    Returns:
+        PIL.Image.Image: Decoded image
+        
+    Raises:
+        ImageTooLargeError: If the image dimensions are over the configured limits
+    """
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    try:
+        image = Image.open(source)
+        width, height = image.size
+        if max(width, height) > MAX_IMAGE_SIDE or width * height > MAX_IMAGE_PIXELS:
+            raise ImageTooLargeError(f"Image is too large ({width}x{height})")
+        if image.format == 'JPEG':
+            image.draft('RGB', DRAFT_SIZE)
+        image.load()
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning) as e:
+        raise ImageTooLargeError(f"Image is too large: {str(e)}")
+    return image
+
+
+def extract_table_from_chart(image_source, timings=None, profile=None):
     """
     Extract tabular data from a chart image
     
     Args:
-        image_path (str): Path to the chart image
+        image_source: Path to the chart image, its raw bytes, a file-like object or a PIL image
+        timings (dict): Optional dict that receives per-stage durations in milliseconds
+            (decode_ms, batch_wait_ms, preprocess_ms, generate_ms, parse_ms) and tokens
+        profile (str): Generation profile ('fast', 'balanced' or 'accurate')
         
     Returns:
-        tuple: (title, headers, data, formatted_table, table_str)
+        ChartTable: Unpacks as (title, headers, data, formatted_table, raw_output)
     """
-    # Load model and processor
-    logger.info("Loading Pix2Struct model and processor")
-    processor = Pix2StructProcessor.from_pretrained('google/deplot')
-    model = Pix2StructForConditionalGeneration.from_pretrained('google/deplot')
+    # Load image; decode pixels here, in the calling thread, rather than inside the batch worker
+    if isinstance(image_source, str):
+        logger.info(f"Processing image: {image_source}")
+    start = time.monotonic()
+    image = load_image(image_source)
+    decode_s = time.monotonic() - start
+    extraction_stage_seconds.observe(decode_s, stage='decode')
+    if timings is not None:
+        timings['decode_ms'] = decode_s * 1000.0
     
-    # Load image
-    logger.info(f"Processing image: {image_path}")
-    image = Image.open(image_path)
+    return extract_table_from_image(image, timings, profile)
+
+
+def extract_table_from_image(image, timings=None, profile=None):
+    """
+    Extract tabular data from an already decoded chart image
     
-    # Generate table data
+    Args:
+        image (PIL.Image.Image): Chart image
+        timings (dict): Optional dict that receives per-stage durations in milliseconds
+        profile (str): Generation profile ('fast', 'balanced' or 'accurate')
+        
+    Returns:
+        ChartTable: Unpacks as (title, headers, data, formatted_table, raw_output)
+    """
+    # Generate table data; concurrent requests are decoded together by the batcher
     logger.info("Generating table data from image")
-    inputs = processor(images=image, text="Generate underlying data table of the figure below:", return_tensors="pt")
-    predictions = model.generate(**inputs, max_new_tokens=512)
-    raw_output = processor.decode(predictions[0], skip_special_tokens=True)
+    raw_output = batcher.generate(image, timings, profile)
     
     logger.debug(f"Raw output from model: {raw_output}")
     
+    start = time.monotonic()
+    result = parse_table_output(raw_output)
+    parse_s = time.monotonic() - start
+    extraction_stage_seconds.observe(parse_s, stage='parse')
+    if timings is not None:
+        timings['parse_ms'] = parse_s * 1000.0
+    return result
+
+
+def parse_table_output(raw_output):
+    """
+    Parse raw DePlot output into a title, headers and rows
+    
+    Args:
+        raw_output (str): Decoded model output with <0x0A> row separators
+        
+    Returns:
+        ChartTable: Unpacks as (title, headers, data, formatted_table, raw_output)
+    """
     # Process the raw output into a list of lists for tabulation
     lines = raw_output.split('<0x0A>')
     headers = [] 
@@ -139,80 +233,150 @@ def extract_table_from_chart(image_path):
         headers = ["Column 1"]
         data = [["No data extracted"]]
     
-    # Format the table for display
-    formatted_table = tabulate(data, headers=headers, tablefmt="grid")
-    
-    # Format the table for LLM input
-    table_str = tabulate(data, headers=headers, tablefmt="pipe")
-    
     # Log the raw text to help with debugging
     logger.info(f"Raw text from model: {raw_output[:200]}...")
     logger.info(f"Table data extraction complete - Title: {title}, Headers: {headers}, Rows: {len(data)}")
     
-    return title, headers, data, formatted_table, raw_output
+    # Grid and pipe renderings are built lazily by ChartTable when first needed
+    return ChartTable(title, headers, data, raw_output)
 
 
 def ask_local_llm(question, table_data="", title="", model="llama3"):
     """Ask a question to the local LLM using Ollama"""
-    try:
-        # Check if the question is about colors or visual elements
-        is_color_question = any(term in question.lower() for term in ["color", "colours", "visual", "appearance", "style", "design", "scheme"])
-        
-        # Prepare the prompt with enhanced instructions for visual analysis
-        base_prompt = f"""Title: {title}
-Data: {table_data}
-Question: {question}
-"""
+    return generate_reply(build_prompt(question, table_data, title), model)
 
-        # Add specific instructions based on the question type
-        if is_color_question:
-            prompt = base_prompt + """
-IMPORTANT: Your task is to analyze the visual elements of this chart, with special attention to colors. Please provide:
-1. A detailed description of all colors used in the chart
-2. What each color represents in the context of the data
-3. How colors are used to distinguish between different data points, categories, or values
-4. Any color patterns, gradients, or visual indicators of importance
-5. How effectively the color scheme communicates the data
-
-Focus primarily on the VISUAL APPEARANCE rather than just the numeric data."""
-        else:
-            prompt = base_prompt + """
-Please provide a detailed answer based on the data and question above. When relevant, include observations about the visual elements of the chart, including colors and design."""
+
+def generate_reply(prompt, model="llama3", context=None, meta=None):
+    """
+    Run one non-streaming Ollama generation
+    
+    Args:
+        prompt (str): Prompt text for this turn only
+        model (str): Ollama model name
+        context (list): Token context returned by a previous turn; Ollama then skips
+            re-evaluating the conversation so far
+        meta (dict): Optional dict that receives the final response fields
+            (context, prompt_eval_count, eval_count and the durations), or
+            status_code when Ollama answers with an HTTP error
+        
+    Returns:
+        str: The answer, or a message starting with "Error:"
+    """
+    try:
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False
+        }
+        if context:
+            payload["context"] = context
 
         # Make the request to Ollama with increased timeout
-        response = requests.post(
-            'http://localhost:11434/api/generate',
-            json={
-                "model": model,
-                "prompt": prompt,
-                "stream": False
-            },
-            timeout=420  # 7 minutes timeout
-        )
+        response = ollama.generate(payload)
         
         if response.status_code == 200:
-            return response.json()['response']
+            body = response.json()
+            observe_ollama(body)
+            if meta is not None:
+                meta.update({key: value for key, value in body.items() if key != 'response'})
+            return body['response']
         else:
             error_msg = f"Error from Ollama API: {response.status_code} - {response.text}"
             logger.error(error_msg)
+            if meta is not None:
+                meta['status_code'] = response.status_code
             return f"Error: {error_msg}"
             
     except requests.exceptions.Timeout:
         logger.error("Timeout while waiting for Ollama response")
-        return "Error: Request timed out after 7 minutes. Please try again with a simpler question or a different model."
+        return f"Error: Request timed out after {ollama.read_timeout / 60:g} minutes. Please try again with a simpler question or a different model."
     except requests.exceptions.RequestException as e:
         logger.error(f"Error communicating with Ollama: {str(e)}")
         return f"Error: {str(e)}"
 
 
+class LLMStreamError(Exception):
+    """Raised by stream_local_llm when Ollama fails mid-stream"""
+
+
+def stream_local_llm(question, table_data="", title="", model="llama3"):
+    """
+    Ask a question to the local LLM and yield the answer token by token
+    
+    Yields:
+        str: Answer fragments as Ollama produces them
+        
+    Raises:
+        LLMStreamError: If Ollama cannot be reached or reports an error
+    """
+    return stream_reply(build_prompt(question, table_data, title), model)
+
+
+def stream_reply(prompt, model="llama3", context=None, meta=None):
+    """
+    Run one streaming Ollama generation
+    
+    Consumes Ollama's NDJSON stream. Closing the generator (for example when the
+    HTTP client disconnects) closes the upstream connection, which makes Ollama
+    abandon the generation.
+    
+    Args:
+        prompt (str): Prompt text for this turn only
+        model (str): Ollama model name
+        context (list): Token context returned by a previous turn
+        meta (dict): Optional dict that receives the fields of the final chunk
+            (context, prompt_eval_count, eval_count and the durations)
+    
+    Yields:
+        str: Answer fragments as Ollama produces them
+        
+    Raises:
+        LLMStreamError: If Ollama cannot be reached or reports an error
+    """
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True
+    }
+    if context:
+        payload["context"] = context
+    try:
+        # The read timeout bounds the gap between chunks, including prompt evaluation
+        response = ollama.generate(payload, stream=True)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error communicating with Ollama: {str(e)}")
+        raise LLMStreamError(str(e))
+
+    try:
+        if response.status_code != 200:
+            error_msg = f"Error from Ollama API: {response.status_code} - {response.text}"
+            logger.error(error_msg)
+            raise LLMStreamError(error_msg)
+
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get('error'):
+                raise LLMStreamError(chunk['error'])
+            if chunk.get('response'):
+                yield chunk['response']
+            if chunk.get('done'):
+                observe_ollama(chunk)
+                if meta is not None:
+                    meta.update({key: value for key, value in chunk.items() if key != 'response'})
+                break
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Ollama stream interrupted: {str(e)}")
+        raise LLMStreamError(str(e))
+    finally:
+        response.close()
+
+
 def check_ollama_status():
     """Check if Ollama is running and get available models"""
     try:
-        response = requests.get('http://localhost:11434/api/tags', timeout=30)  # Increased timeout
-        if response.status_code == 200:
-            models = [model['name'] for model in response.json()['models']]
-            return True, models
-        return False, []
+        return True, ollama.list_models(timeout=30)
     except requests.exceptions.RequestException as e:
         logger.error(f"Error checking Ollama status: {str(e)}")
         return False, []
@@ -0,0 +1,119 @@
+"""
+Inference mode comparison - Runs a fixed set of sample charts through DePlot in each CPU
+inference mode and reports latency against table agreement with the fp32 baseline
+
+Usage:
+    python compare_modes.py samples/ [--modes fp32 int8 bf16] [--repeats 3] [--json report.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import logging
+
+from PIL import Image
+from tabulate import tabulate
+
+from model_registry import ModelRegistry, INFERENCE_MODES, DEPLOT_PROMPT, configure_threads
+from chart_analyzer import parse_table_output
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+
+
+def load_samples(sample_dir):
+    """Load every chart image in sample_dir, sorted by name so runs are comparable"""
+    names = sorted(name for name in os.listdir(sample_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+    samples = []
+    for name in names:
+        image = Image.open(os.path.join(sample_dir, name))
+        image.load()
+        samples.append((name, image))
+    return samples
+
+
+def run_mode(mode, samples, repeats, max_new_tokens):
+    """
+    Decode every sample in one inference mode
+
+    Returns:
+        tuple: (per-sample raw outputs, per-sample median latency in ms, load time in s)
+    """
+    registry = ModelRegistry(mode=mode)
+    start = time.perf_counter()
+    processor, model, mode = registry.current()
+    load_time = time.perf_counter() - start
+
+    outputs, latencies = {}, {}
+    for name, image in samples:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            inputs = processor(images=image, text=DEPLOT_PROMPT, return_tensors="pt")
+            with registry.inference_context(mode):
+                predictions = model.generate(**inputs, max_new_tokens=max_new_tokens)
+            outputs[name] = processor.decode(predictions[0], skip_special_tokens=True)
+            timings.append((time.perf_counter() - start) * 1000.0)
+        latencies[name] = statistics.median(timings)
+    registry.unload()
+    return outputs, latencies, load_time
+
+
+def tables_match(raw_a, raw_b):
+    """Whether two raw outputs parse to the same title, headers and rows"""
+    table_a, table_b = parse_table_output(raw_a), parse_table_output(raw_b)
+    return table_a.title == table_b.title and table_a.headers == table_b.headers and table_a.data == table_b.data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare DePlot CPU inference modes on sample charts")
+    parser.add_argument('sample_dir', help="Directory of sample chart images")
+    parser.add_argument('--modes', nargs='+', default=list(INFERENCE_MODES), choices=INFERENCE_MODES)
+    parser.add_argument('--repeats', type=int, default=3, help="Timed runs per chart (median is reported)")
+    parser.add_argument('--max-new-tokens', type=int, default=512)
+    parser.add_argument('--json', help="Also write the report as JSON to this path")
+    args = parser.parse_args(argv)
+
+    configure_threads()
+    samples = load_samples(args.sample_dir)
+    if not samples:
+        logger.error(f"No chart images found in {args.sample_dir}")
+        return 1
+
+    # fp32 is always run first: it is the reference the other modes are checked against
+    modes = ['fp32'] + [mode for mode in args.modes if mode != 'fp32']
+    results = {}
+    for mode in modes:
+        logger.info(f"Running {len(samples)} charts in {mode} mode")
+        results[mode] = run_mode(mode, samples, args.repeats, args.max_new_tokens)
+
+    baseline_outputs, baseline_latencies, _ = results['fp32']
+    baseline_total = sum(baseline_latencies.values())
+    report = []
+    for mode in modes:
+        outputs, latencies, load_time = results[mode]
+        total = sum(latencies.values())
+        report.append({
+            "mode": mode,
+            "load_s": round(load_time, 2),
+            "median_ms_per_chart": round(statistics.median(latencies.values()), 1),
+            "speedup_vs_fp32": round(baseline_total / total, 2) if total else 0.0,
+            "exact_output_match": sum(outputs[name] == baseline_outputs[name] for name in outputs),
+            "table_match": sum(tables_match(outputs[name], baseline_outputs[name]) for name in outputs),
+            "charts": len(samples)
+        })
+
+    print(tabulate(report, headers="keys", tablefmt="grid"))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"samples": [name for name, _ in samples], "modes": report}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
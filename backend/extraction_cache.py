@@ -0,0 +1,83 @@
+"""
+Extraction cache - Content-addressed cache of DePlot table extractions, keyed by a hash
+of the uploaded image bytes plus the model and generation parameters
+"""
+
+import os
+import hashlib
+import json
+
+from cache import TieredCache, MISSING
+from model_registry import registry as model_registry
+from generation import resolve_profile
+from table import ChartTable
+
+# Cache configuration, overridable through the environment
+CACHE_MAX_ENTRIES = int(os.environ.get('EXTRACTION_CACHE_SIZE', 256))
+CACHE_TTL = int(os.environ.get('EXTRACTION_CACHE_TTL', 7 * 24 * 3600))
+CACHE_DB_PATH = os.environ.get('EXTRACTION_CACHE_DB') or None
+
+extraction_cache = TieredCache('extractions', CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_DB_PATH)
+
+
+def image_hash(image_bytes):
+    """SHA-256 hex digest of the raw uploaded bytes"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def extraction_key(digest, profile=None):
+    """
+    Build the cache key for an image digest
+
+    The key covers the model checkpoint and generation parameters so that
+    switching model or decoding settings never serves stale tables.
+
+    Args:
+        digest (str): image_hash() of the upload
+        profile (str): Generation profile name; the default profile if None
+    """
+    profile, settings = resolve_profile(profile)
+    params = {
+        'model_id': model_registry.model_id,
+        'revision': model_registry.revision,
+        'inference_mode': model_registry.mode,
+        'profile': profile,
+        'generation': settings,
+    }
+    return f"{digest}:{hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]}"
+
+
+def get_cached_extraction(key):
+    """
+    Look up a cached extraction
+
+    Returns:
+        ChartTable or None: The cached table on a hit
+    """
+    value = extraction_cache.get(key)
+    if value is MISSING:
+        return None
+    return ChartTable.from_cache(value)
+
+
+def cache_extraction(key, table):
+    """Store an extracted ChartTable (without its renderings)"""
+    extraction_cache.set(key, table.to_cache())
+
+
+def get_cached_panels(key):
+    """
+    Look up a cached dashboard extraction
+
+    Returns:
+        list or None: One dict per panel on a hit
+    """
+    value = extraction_cache.get(key)
+    if value is MISSING:
+        return None
+    return value
+
+
+def cache_panels(key, panels):
+    """Store the list of per-panel tables of a dashboard"""
+    extraction_cache.set(key, list(panels))
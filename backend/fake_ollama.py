@@ -0,0 +1,261 @@
+"""
+Fake Ollama - Stand-in for the Ollama HTTP API with configurable latency and token rates,
+so the LLM endpoints can be benchmarked offline and without a GPU
+
+Serves /api/tags and /api/generate (streaming and non-streaming, with token contexts)
+using only the standard library. Generated text is filler; timings follow the
+configured rates and are reported in Ollama's own *_duration/*_count fields.
+
+Usage:
+    python fake_ollama.py [--port 11434] [--token-rate 40] [--prompt-rate 400] [--parallel 1]
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODELS = ('llama3',)
+
+# Rough prompt tokenization, matching the estimate prompt_builder uses for budgets
+CHARS_PER_TOKEN = 4.0
+
+FILLER = ("Based on the chart data the highest value belongs to the second category "
+          "while the remaining categories stay close to the overall average").split()
+
+
+class FakeOllamaConfig:
+    """
+    Latency model of the fake server
+
+    Args:
+        models (list): Model names reported by /api/tags
+        token_rate (float): Generated tokens per second
+        prompt_rate (float): Prompt tokens evaluated per second; context tokens are not re-evaluated
+        answer_tokens (int): Tokens generated per request (num_predict overrides it)
+        latency_ms (float): Fixed overhead added to every generation
+        load_ms (float): One-off load time for the first request to each model
+        jitter (float): Random +/- fraction applied to each delay
+        parallel (int): Generations run at once; the rest queue, like OLLAMA_NUM_PARALLEL
+        seed (int): Seed for the jitter, so runs are repeatable
+    """
+
+    def __init__(self, models=DEFAULT_MODELS, token_rate=40.0, prompt_rate=400.0, answer_tokens=48,
+                 latency_ms=0.0, load_ms=0.0, jitter=0.0, parallel=1, seed=0):
+        self.models = list(models)
+        self.token_rate = token_rate
+        self.prompt_rate = prompt_rate
+        self.answer_tokens = answer_tokens
+        self.latency_ms = latency_ms
+        self.load_ms = load_ms
+        self.jitter = jitter
+        self.parallel = max(1, parallel)
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class FakeOllama:
+    """Generation state shared by the request handlers: loaded models, slots and counters"""
+
+    def __init__(self, config):
+        self.config = config
+        self._slots = threading.BoundedSemaphore(config.parallel)
+        self._lock = threading.Lock()
+        self._loaded = set()
+        self._random = random.Random(config.seed)
+        self.requests = 0
+
+    def _delay(self, seconds):
+        if self.config.jitter and seconds > 0:
+            with self._lock:
+                seconds *= 1.0 + self._random.uniform(-self.config.jitter, self.config.jitter)
+        return max(0.0, seconds)
+
+    def _load(self, model):
+        """Simulated load time for a model's first request, zero once it is resident"""
+        with self._lock:
+            self.requests += 1
+            if model in self._loaded:
+                return 0.0
+            self._loaded.add(model)
+        return self._delay(self.config.load_ms / 1000.0)
+
+    def generate(self, payload):
+        """
+        Yield (text, final fields) pairs; final fields is None until the last chunk
+
+        Sleeps between tokens at the configured rate while holding one of the
+        parallel slots, so concurrent requests queue the way they do in Ollama.
+        """
+        config = self.config
+        model = payload.get('model') or config.models[0]
+        context = list(payload.get('context') or [])
+        prompt_tokens = max(1, int(len(payload.get('prompt', '')) / CHARS_PER_TOKEN))
+        answer_tokens = int((payload.get('options') or {}).get('num_predict') or config.answer_tokens)
+
+        with self._slots:
+            start = time.perf_counter()
+            load = self._load(model)
+            time.sleep(load + self._delay(config.latency_ms / 1000.0))
+            prompt_eval = self._delay(prompt_tokens / config.prompt_rate) if config.prompt_rate > 0 else 0.0
+            time.sleep(prompt_eval)
+            eval_start = time.perf_counter()
+            for i in range(answer_tokens):
+                if config.token_rate > 0:
+                    time.sleep(self._delay(1.0 / config.token_rate))
+                yield (' ' if i else '') + FILLER[i % len(FILLER)], None
+            eval_duration = time.perf_counter() - eval_start
+            total = time.perf_counter() - start
+
+        # Fake token ids: the old context, then the new prompt and answer
+        context.extend(range(len(context), len(context) + prompt_tokens + answer_tokens))
+        yield '', {
+            "model": model,
+            "done": True,
+            "done_reason": "stop",
+            "context": context,
+            "total_duration": int(total * 1e9),
+            "load_duration": int(load * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_eval * 1e9),
+            "eval_count": answer_tokens,
+            "eval_duration": int(eval_duration * 1e9)
+        }
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """HTTP/1.1 handler; streamed generations use chunked encoding of NDJSON lines like Ollama"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            models = [{"name": name, "model": name, "size": 0, "details": {"family": "fake"}}
+                      for name in self.server.ollama.config.models]
+            self._json(200, {"models": models})
+        elif self.path == '/api/version':
+            self._json(200, {"version": "0.0.0-fake"})
+        elif self.path == '/':
+            self._json(200, {"status": "Ollama is running"})
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != '/api/generate':
+            self._json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._json(400, {"error": "invalid JSON body"})
+            return
+        model = payload.get('model')
+        if model and model not in self.server.ollama.config.models:
+            self._json(404, {"error": f"model '{model}' not found"})
+            return
+
+        chunks = self.server.ollama.generate(payload)
+        if payload.get('stream', True) is False:
+            parts = []
+            for text, final in chunks:
+                parts.append(text)
+            final['response'] = ''.join(parts)
+            self._json(200, final)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for text, final in chunks:
+                line = final if final is not None else {"model": model, "response": text, "done": False}
+                if final is not None:
+                    line['response'] = ''
+                data = (json.dumps(line) + '\n').encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away mid-stream; closing the generator frees the slot
+            chunks.close()
+            self.close_connection = True
+
+
+def start_fake_ollama(config=None, host='127.0.0.1', port=0):
+    """
+    Start a fake Ollama server on a background thread
+
+    Args:
+        config (FakeOllamaConfig): Latency model; defaults if None
+        port (int): Port to bind, 0 for any free port
+
+    Returns:
+        ThreadingHTTPServer: Running server; its base URL is server.url, stop it with shutdown()
+    """
+    server = ThreadingHTTPServer((host, port), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.ollama = FakeOllama(config or FakeOllamaConfig())
+    server.url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    logger.info(f"Fake Ollama listening on {server.url}")
+    return server
+
+
+def add_config_arguments(parser):
+    """Fake Ollama latency options, shared with benchmark.py"""
+    parser.add_argument('--models', nargs='+', default=list(DEFAULT_MODELS), help="Model names to report")
+    parser.add_argument('--token-rate', type=float, default=40.0, help="Generated tokens per second")
+    parser.add_argument('--prompt-rate', type=float, default=400.0, help="Prompt tokens evaluated per second")
+    parser.add_argument('--answer-tokens', type=int, default=48, help="Tokens generated per request")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Fixed overhead per generation")
+    parser.add_argument('--load-ms', type=float, default=0.0, help="One-off load time per model")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random +/- fraction applied to delays")
+    parser.add_argument('--parallel', type=int, default=1, help="Generations served at once")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def config_from_args(args):
+    return FakeOllamaConfig(models=args.models, token_rate=args.token_rate, prompt_rate=args.prompt_rate,
+                            answer_tokens=args.answer_tokens, latency_ms=args.latency_ms, load_ms=args.load_ms,
+                            jitter=args.jitter, parallel=args.parallel, seed=args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server with configurable latency")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    server = start_fake_ollama(config_from_args(args), args.host, args.port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Extraction job queue - Runs chart extractions on a bounded worker pool so clients can
+submit an image, get a job id immediately and poll for the result
+"""
+
+import os
+import queue
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Job queue configuration, overridable through the environment
+JOB_WORKERS = int(os.environ.get('EXTRACTION_JOB_WORKERS', 4))
+JOB_QUEUE_DEPTH = int(os.environ.get('EXTRACTION_JOB_QUEUE_DEPTH', 64))
+JOB_RESULT_TTL = int(os.environ.get('EXTRACTION_JOB_RESULT_TTL', 3600))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueueFull(Exception):
+    """Raised by JobQueue.submit when the queue is at its configured depth"""
+
+    def __init__(self, retry_after):
+        super().__init__("Extraction queue is full")
+        self.retry_after = retry_after
+
+
+class Job:
+    """A queued unit of work and its per-stage timings"""
+
+    def __init__(self, fn, args):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.args = args
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.timings = {}
+        self._enqueued = time.monotonic()
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+            "timings": {name: round(value, 2) for name, value in self.timings.items()},
+            "error": self.error
+        }
+
+
+class JobQueue:
+    """
+    Bounded FIFO of jobs drained by a fixed pool of worker threads.
+
+    Each job function is called as fn(*args, timings=job.timings) so it can record
+    its own stage durations; the queue adds queue_wait_ms and total_ms. Finished
+    jobs are kept for result_ttl seconds.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_depth=JOB_QUEUE_DEPTH, result_ttl=JOB_RESULT_TTL):
+        self.workers = max(1, workers)
+        self.max_depth = max(1, max_depth)
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=self.max_depth)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._durations = []  # Recent job durations used for the Retry-After estimate
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'extraction-job-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, fn, *args):
+        """
+        Queue fn(*args) as a job
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            JobQueueFull: If max_depth jobs are already waiting
+        """
+        self.start()
+        self._prune()
+        job = Job(fn, args)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise JobQueueFull(self.retry_after())
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout):
+        """Long-poll: block up to timeout seconds for the job to finish"""
+        job = self.get(job_id)
+        if job is not None and timeout > 0:
+            job.done.wait(timeout)
+        return job
+
+    def retry_after(self):
+        """Rough number of seconds until a queue slot frees up"""
+        with self._lock:
+            recent = self._durations[-20:]
+        average = sum(recent) / len(recent) if recent else 10.0
+        return max(1, int(average * self._queue.qsize() / self.workers))
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "max_depth": self.max_depth,
+            "queue_depth": self._queue.qsize(),
+            "queued": statuses.count(QUEUED),
+            "running": statuses.count(RUNNING),
+            "done": statuses.count(DONE),
+            "failed": statuses.count(FAILED)
+        }
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job.timings['queue_wait_ms'] = (time.monotonic() - job._enqueued) * 1000.0
+            job.status = RUNNING
+            start = time.monotonic()
+            try:
+                job.result = job.fn(*job.args, timings=job.timings)
+                job.status = DONE
+            except Exception as e:
+                logger.error(f"Extraction job {job.id} failed: {str(e)}")
+                job.error = str(e)
+                job.status = FAILED
+            # The arguments (the uploaded image bytes) are not needed once the job has run
+            job.args = None
+            duration = time.monotonic() - start
+            job.timings['total_ms'] = job.timings['queue_wait_ms'] + duration * 1000.0
+            job.finished_at = time.time()
+            with self._lock:
+                self._durations.append(duration)
+                del self._durations[:-100]
+            job.done.set()
+
+    def _prune(self):
+        """Forget finished jobs older than result_ttl"""
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+# Process-wide extraction job queue
+job_queue = JobQueue()
@@ -0,0 +1,236 @@
+"""
+Metrics - Minimal Prometheus text-format counters, gauges and histograms for the
+extraction and LLM paths, served by /metrics
+"""
+
+import bisect
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from cache-hit scale up to slow CPU generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class: a named metric family with fixed label names"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, set directly or read from a callback at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), callback=None):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+        self._callback = callback
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self):
+        if self._callback is not None:
+            # The callback returns {label values tuple: value}, or a plain number without labels
+            try:
+                values = self._callback()
+            except Exception as e:
+                logger.warning(f"Metric callback for {self.name} failed: {str(e)}")
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in sorted(values.items())]
+
+
+class CallbackCounter(Gauge):
+    """Counter whose values are read from an existing stats() call at scrape time"""
+
+    kind = 'counter'
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count of observed values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            snapshot = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        lines = []
+        for key, (counts, total, count) in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Ordered collection of metric families rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=(), callback=None):
+        return self.register(Gauge(name, help_text, labelnames, callback))
+
+    def callback_counter(self, name, help_text, labelnames, callback):
+        return self.register(CallbackCounter(name, help_text, labelnames, callback))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry and the metrics recorded on the hot paths
+metrics = MetricsRegistry()
+
+extraction_stage_seconds = metrics.histogram(
+    'chartqa_extraction_stage_seconds',
+    'Time spent in each chart extraction stage (upload_read, decode, batch_wait, preprocess, generate, parse)',
+    ('stage',)
+)
+ollama_duration_seconds = metrics.histogram(
+    'chartqa_ollama_duration_seconds',
+    'Ollama generation durations reported by Ollama itself (load, prompt_eval, eval, total)',
+    ('phase',)
+)
+ollama_tokens = metrics.counter(
+    'chartqa_ollama_tokens_total',
+    'Tokens processed by Ollama (prompt = evaluated prompt tokens, generated = output tokens)',
+    ('kind',)
+)
+http_requests = metrics.counter(
+    'chartqa_http_requests_total',
+    'HTTP requests handled, by endpoint and status code',
+    ('endpoint', 'status')
+)
+http_request_seconds = metrics.histogram(
+    'chartqa_http_request_seconds',
+    'Time to produce an HTTP response, by endpoint (streamed bodies are not included)',
+    ('endpoint',)
+)
+http_in_flight = metrics.gauge(
+    'chartqa_http_requests_in_flight',
+    'HTTP requests currently being handled'
+)
+
+# Ollama reports its durations in nanoseconds
+OLLAMA_DURATIONS = (('load', 'load_duration'), ('prompt_eval', 'prompt_eval_duration'),
+                    ('eval', 'eval_duration'), ('total', 'total_duration'))
+
+
+def observe_ollama(response):
+    """Record the timing and token fields of Ollama's final generate response"""
+    for phase, field in OLLAMA_DURATIONS:
+        value = response.get(field)
+        if value:
+            ollama_duration_seconds.observe(value / 1e9, phase=phase)
+    if response.get('prompt_eval_count'):
+        ollama_tokens.inc(response['prompt_eval_count'], kind='prompt')
+    if response.get('eval_count'):
+        ollama_tokens.inc(response['eval_count'], kind='generated')
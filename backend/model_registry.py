@@ -0,0 +1,214 @@
+"""
+Model registry - Loads the DePlot (Pix2Struct) processor and model once per process
+and shares them between requests. torch and transformers are imported on first use,
+so importing this module (and the Flask app) stays fast
+"""
+
+import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from collections import namedtuple
+
+from tiny_model import TINY_MODEL_ID, build_tiny_pix2struct
+
+logger = logging.getLogger(__name__)
+
+# Default checkpoint, overridable through the environment
+DEFAULT_MODEL_ID = os.environ.get('DEPLOT_MODEL_ID', 'google/deplot')
+DEFAULT_REVISION = os.environ.get('DEPLOT_MODEL_REVISION') or None
+
+# DEPLOT_TINY=1 swaps in a randomly initialized tiny Pix2Struct (no download), for offline benchmarks
+if os.environ.get('DEPLOT_TINY', '0') != '0':
+    DEFAULT_MODEL_ID = TINY_MODEL_ID
+
+# CPU inference mode: 'fp32' (baseline), 'int8' (dynamically quantized Linear layers) or 'bf16' (autocast)
+INFERENCE_MODES = ('fp32', 'int8', 'bf16')
+DEFAULT_INFERENCE_MODE = os.environ.get('DEPLOT_INFERENCE_MODE', 'fp32').lower()
+
+# Torch thread pools; 0 keeps torch's defaults
+NUM_THREADS = int(os.environ.get('DEPLOT_NUM_THREADS', 0))
+NUM_INTEROP_THREADS = int(os.environ.get('DEPLOT_NUM_INTEROP_THREADS', 0))
+
+# Text prompt DePlot expects alongside the chart image
+DEPLOT_PROMPT = "Generate underlying data table of the figure below:"
+
+# One loaded model and the inference mode it was prepared for
+LoadedModel = namedtuple('LoadedModel', ['processor', 'model', 'mode'])
+
+
+def configure_threads(num_threads=NUM_THREADS, num_interop_threads=NUM_INTEROP_THREADS):
+    """
+    Set torch's intra-op and inter-op thread counts
+
+    The inter-op pool can only be sized before torch runs any parallel work, so a
+    late call is logged and ignored.
+    """
+    import torch
+
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            logger.warning(f"Could not set inter-op threads: {str(e)}")
+    logger.info(f"Torch threads: intra-op={torch.get_num_threads()}, inter-op={torch.get_num_interop_threads()}")
+
+
+class ModelRegistry:
+    """
+    Thread-safe holder for a single Pix2Struct processor/model pair.
+
+    The first call to get() loads the weights; every later call returns the same
+    objects. unload() drops them so the next get() (or reload()) loads afresh.
+    Processor, model and inference mode are held as one LoadedModel tuple, so a
+    reader never mixes parts of two loads, e.g. an int8 model with bf16 autocast
+    while a reload swaps modes.
+    """
+
+    def __init__(self, model_id=DEFAULT_MODEL_ID, revision=DEFAULT_REVISION, mode=DEFAULT_INFERENCE_MODE):
+        if mode not in INFERENCE_MODES:
+            raise ValueError(f"Unknown inference mode '{mode}', expected one of {', '.join(INFERENCE_MODES)}")
+        self.model_id = model_id
+        self.revision = revision
+        self.mode = mode
+        self._loaded = None  # LoadedModel
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._loaded is not None
+
+    def current(self):
+        """
+        Return the loaded model with its inference mode, loading it on first use
+
+        Generate calls should take processor, model and mode from one current()
+        call and pass the mode to inference_context().
+
+        Returns:
+            LoadedModel: (processor, model, mode)
+        """
+        # Fast path without taking the lock once the model is resident
+        loaded = self._loaded
+        if loaded is not None:
+            return loaded
+
+        with self._lock:
+            if self._loaded is None:
+                self._loaded = self._load(self.model_id, self.revision, self.mode)
+            return self._loaded
+
+    def get(self):
+        """
+        Return the loaded (processor, model) pair, loading it on first use
+
+        Returns:
+            tuple: (processor, model)
+        """
+        processor, model, _ = self.current()
+        return processor, model
+
+    def preload(self):
+        """Load the model eagerly, e.g. at server startup"""
+        self.get()
+
+    def warmup(self, max_new_tokens=8):
+        """
+        Run a short generate on a blank image so torch initializes its kernels and
+        thread pools before the first real request
+
+        Returns:
+            float: Warmup time in seconds
+        """
+        from PIL import Image
+
+        processor, model, mode = self.current()
+        start = time.perf_counter()
+        inputs = processor(images=Image.new('RGB', (256, 256), 'white'), text=DEPLOT_PROMPT, return_tensors="pt")
+        with self.inference_context(mode):
+            model.generate(**inputs, max_new_tokens=max_new_tokens)
+        return time.perf_counter() - start
+
+    def unload(self):
+        """Drop the loaded processor and model so their memory can be reclaimed"""
+        with self._lock:
+            if self._loaded is not None:
+                logger.info(f"Unloading DePlot model {self.model_id}")
+            self._loaded = None
+
+    def reload(self, model_id=None, revision=None, mode=None):
+        """
+        Replace the loaded model, optionally switching checkpoint or inference mode
+
+        The new model is loaded while the current one keeps serving requests, then
+        swapped in; if loading fails the current model, id, revision and mode are
+        kept. Both models are resident in memory while the new one loads.
+
+        Args:
+            model_id (str): Hugging Face model id; keeps the current one if None
+            revision (str): Model revision (branch, tag or commit hash)
+            mode (str): 'fp32', 'int8' or 'bf16'; keeps the current mode if None
+
+        Raises:
+            ValueError: If mode is not a known inference mode
+        """
+        if mode is not None and mode not in INFERENCE_MODES:
+            raise ValueError(f"Unknown inference mode '{mode}', expected one of {', '.join(INFERENCE_MODES)}")
+        with self._lock:
+            if model_id is None:
+                model_id, revision = self.model_id, self.revision
+            mode = mode or self.mode
+            loaded = self._load(model_id, revision, mode)
+            self.model_id, self.revision, self.mode = model_id, revision, mode
+            self._loaded = loaded
+
+    @contextmanager
+    def inference_context(self, mode):
+        """
+        Wrap generate calls: always inference_mode, plus bf16 autocast in 'bf16' mode
+
+        Args:
+            mode (str): The mode from the same current() call as the model
+        """
+        import torch
+
+        with torch.inference_mode():
+            if mode == 'bf16':
+                with torch.autocast(device_type='cpu', dtype=torch.bfloat16):
+                    yield
+            else:
+                yield
+
+    def _load(self, model_id, revision, mode):
+        """
+        Load a processor and model without touching the registry's state
+
+        Returns:
+            LoadedModel: (processor, model, mode)
+        """
+        import torch
+        from transformers import Pix2StructProcessor, Pix2StructForConditionalGeneration
+
+        logger.info(f"Loading Pix2Struct model and processor: {model_id} "
+                    f"(revision={revision}, mode={mode})")
+        start = time.perf_counter()
+        if model_id == TINY_MODEL_ID:
+            processor, model = build_tiny_pix2struct()
+        else:
+            processor = Pix2StructProcessor.from_pretrained(model_id, revision=revision)
+            model = Pix2StructForConditionalGeneration.from_pretrained(model_id, revision=revision)
+        model.eval()
+        for param in model.parameters():
+            param.requires_grad_(False)
+        if mode == 'int8':
+            # Quantize Linear weights to int8; activations are quantized on the fly per batch
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        logger.info(f"DePlot model {model_id} loaded in {time.perf_counter() - start:.1f}s")
+        return LoadedModel(processor, model, mode)
+
+
+# Process-wide registry used by chart_analyzer and the Flask app
+registry = ModelRegistry()
@@ -0,0 +1,148 @@
+"""
+Ollama client - Shared, pooled keep-alive HTTP client for all traffic to the local
+Ollama server
+"""
+
+import os
+import threading
+import time
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Client configuration, overridable through the environment
+OLLAMA_BASE_URL = os.environ.get('OLLAMA_BASE_URL', 'http://localhost:11434').rstrip('/')
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get('OLLAMA_CONNECT_TIMEOUT', 5))
+OLLAMA_READ_TIMEOUT = float(os.environ.get('OLLAMA_READ_TIMEOUT', 420))  # 7 minutes for long generations
+OLLAMA_POOL_SIZE = int(os.environ.get('OLLAMA_POOL_SIZE', 10))
+# Connection attempts retried for generations; only failures to connect are retried,
+# never read timeouts or errors after the request may have reached Ollama
+OLLAMA_CONNECT_RETRIES = int(os.environ.get('OLLAMA_CONNECT_RETRIES', 2))
+# How long Ollama keeps the model (and its KV cache) loaded after a generation
+OLLAMA_KEEP_ALIVE = os.environ.get('OLLAMA_KEEP_ALIVE', '30m')
+
+
+class OllamaClient:
+    """
+    Thin wrapper around two pooled requests sessions pointed at Ollama.
+
+    Idempotent GET calls go through a session with a retry/backoff policy;
+    POST calls (generations) go through one that only retries failed connection
+    attempts, so an expensive generation is never silently re-run once Ollama
+    may have started it. Latency is recorded per endpoint path.
+    """
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, connect_timeout=OLLAMA_CONNECT_TIMEOUT,
+                 read_timeout=OLLAMA_READ_TIMEOUT, pool_size=OLLAMA_POOL_SIZE, keep_alive=OLLAMA_KEEP_ALIVE):
+        self.base_url = base_url
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+
+        retry_strategy = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=frozenset(['GET', 'HEAD']),
+        )
+        self._idempotent = self._make_session(retry_strategy)
+        self._generation = self._make_session(Retry(
+            total=OLLAMA_CONNECT_RETRIES,
+            connect=OLLAMA_CONNECT_RETRIES,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=0.25,
+            raise_on_status=False,
+        ))
+
+        self._stats_lock = threading.Lock()
+        self._latency = {}
+
+    def _make_session(self, retry_strategy):
+        session = requests.Session()
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _timeout(self, read_timeout):
+        return (self.connect_timeout, self.read_timeout if read_timeout is None else read_timeout)
+
+    def get(self, path, timeout=None):
+        """
+        GET an Ollama endpoint, retrying transient failures
+
+        Args:
+            path (str): Endpoint path, e.g. '/api/tags'
+            timeout (float): Read timeout in seconds; defaults to the client's read timeout
+        """
+        start = time.perf_counter()
+        try:
+            return self._idempotent.get(self.base_url + path, timeout=self._timeout(timeout))
+        finally:
+            self._record(path, start)
+
+    def post(self, path, payload, stream=False, timeout=None):
+        """
+        POST to an Ollama endpoint, retrying only failed connection attempts
+
+        For streaming responses the recorded latency is the time to response headers.
+        """
+        start = time.perf_counter()
+        try:
+            return self._generation.post(self.base_url + path, json=payload, stream=stream,
+                                         timeout=self._timeout(timeout))
+        finally:
+            self._record(path, start)
+
+    def list_models(self, timeout=None):
+        """
+        Return the names of the models Ollama has pulled
+
+        Raises:
+            requests.exceptions.RequestException: If Ollama is unreachable or errors
+        """
+        response = self.get('/api/tags', timeout=timeout)
+        response.raise_for_status()
+        return [model['name'] for model in response.json().get('models', [])]
+
+    def generate(self, payload, stream=False, timeout=None):
+        """POST a generation request to /api/generate, asking Ollama to keep the model resident"""
+        if self.keep_alive:
+            payload = dict(payload)
+            payload.setdefault('keep_alive', self.keep_alive)
+        return self.post('/api/generate', payload, stream=stream, timeout=timeout)
+
+    def stats(self):
+        """Per-endpoint call counts and latency in milliseconds"""
+        with self._stats_lock:
+            stats = {path: dict(entry) for path, entry in self._latency.items()}
+        for entry in stats.values():
+            entry['avg_ms'] = round(entry['total_ms'] / entry['calls'], 2) if entry['calls'] else 0.0
+        return {
+            "base_url": self.base_url,
+            "pool_size": self.pool_size,
+            "connect_timeout": self.connect_timeout,
+            "read_timeout": self.read_timeout,
+            "keep_alive": self.keep_alive,
+            "endpoints": stats
+        }
+
+    def _record(self, path, start):
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        with self._stats_lock:
+            entry = self._latency.setdefault(path, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0})
+            entry['calls'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['last_ms'] = elapsed_ms
+
+
+# Process-wide client shared by chart_analyzer and the Flask app
+ollama = OllamaClient()
@@ -0,0 +1,123 @@
+"""
+Ollama health monitor - Background thread that polls Ollama and publishes an immutable
+status snapshot, so request handlers never probe Ollama themselves
+"""
+
+import os
+import threading
+import time
+import logging
+from collections import namedtuple
+
+import requests
+
+from ollama_client import ollama
+
+logger = logging.getLogger(__name__)
+
+# Polling configuration, overridable through the environment
+HEALTH_INTERVAL = float(os.environ.get('OLLAMA_HEALTH_INTERVAL', 10))
+HEALTH_MAX_BACKOFF = float(os.environ.get('OLLAMA_HEALTH_MAX_BACKOFF', 60))
+HEALTH_PROBE_TIMEOUT = float(os.environ.get('OLLAMA_HEALTH_TIMEOUT', 5))
+
+# Immutable view of the last probe; models is a tuple
+OllamaStatus = namedtuple('OllamaStatus', [
+    'available', 'models', 'checked_at', 'latency_ms', 'status_code', 'raw_response', 'error'
+])
+
+UNKNOWN_STATUS = OllamaStatus(False, (), 0.0, None, None, None, "Ollama has not been checked yet")
+
+
+class OllamaHealthMonitor:
+    """
+    Polls /api/tags on an interval and swaps in a new OllamaStatus after each probe.
+
+    Readers just load the current snapshot attribute, which is O(1) and never
+    blocks on the network. While Ollama is down the polling interval doubles
+    up to max_backoff, and drops back to the base interval once it recovers.
+    """
+
+    def __init__(self, client=ollama, interval=HEALTH_INTERVAL, max_backoff=HEALTH_MAX_BACKOFF,
+                 probe_timeout=HEALTH_PROBE_TIMEOUT):
+        self.client = client
+        self.interval = interval
+        self.max_backoff = max(interval, max_backoff)
+        self.probe_timeout = probe_timeout
+        self._snapshot = UNKNOWN_STATUS
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def snapshot(self):
+        """
+        Return the latest OllamaStatus
+
+        Starts the monitor on first use; if nothing has been probed yet, probes
+        once inline so the very first request does not see a false negative.
+        """
+        if self._thread is None:
+            self.start()
+        if self._snapshot is UNKNOWN_STATUS:
+            self.refresh()
+        return self._snapshot
+
+    def latest(self):
+        """Return the latest OllamaStatus without ever probing (UNKNOWN_STATUS before the first probe)"""
+        return self._snapshot
+
+    def start(self):
+        """Start the polling thread (idempotent)"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='ollama-health', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def refresh(self):
+        """Probe Ollama synchronously, publish and return the new snapshot"""
+        start = time.perf_counter()
+        try:
+            response = self.client.get('/api/tags', timeout=self.probe_timeout)
+            latency_ms = (time.perf_counter() - start) * 1000.0
+            if response.status_code == 200:
+                models = tuple(model['name'] for model in response.json().get('models', []))
+                status = OllamaStatus(True, models, time.time(), latency_ms, 200, response.text[:500], None)
+            else:
+                status = OllamaStatus(False, (), time.time(), latency_ms, response.status_code,
+                                      response.text[:500], f"Ollama API returned status {response.status_code}")
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            latency_ms = (time.perf_counter() - start) * 1000.0
+            status = OllamaStatus(False, (), time.time(), latency_ms, None, None, str(e))
+
+        previous = self._snapshot
+        if previous.available != status.available:
+            if status.available:
+                logger.info(f"Ollama is available with models: {list(status.models)}")
+            else:
+                logger.warning(f"Ollama is unavailable: {status.error}")
+        self._snapshot = status
+        return status
+
+    def _run(self):
+        delay = self.interval
+        while not self._stop.is_set():
+            status = self.refresh()
+            delay = self.interval if status.available else min(delay * 2, self.max_backoff)
+            self._wake.wait(delay)
+            self._wake.clear()
+
+
+# Process-wide monitor read by the Flask endpoints
+health_monitor = OllamaHealthMonitor()
+
+
+def get_ollama_status():
+    """Return (available, models) from the latest health snapshot"""
+    status = health_monitor.snapshot()
+    return status.available, list(status.models)
@@ -0,0 +1,179 @@
+"""
+Panel detection - Splits dashboard images holding several charts into per-panel crops
+using whitespace (gutter) projection profiles, and extracts each panel as its own table
+"""
+
+import os
+import time
+import logging
+
+import numpy as np
+
+from batching import batcher
+from chart_analyzer import load_image, parse_table_output
+
+logger = logging.getLogger(__name__)
+
+# Detection tuning, overridable through the environment
+# Pixels within this distance of the background colour count as empty
+BACKGROUND_TOLERANCE = int(os.environ.get('PANEL_BACKGROUND_TOLERANCE', 12))
+# A row/column is part of a gutter when at most this fraction of its pixels is non-background.
+# The default of 0 means truly blank, so a single axis or grid line keeps a chart in one piece.
+GUTTER_INK_FRACTION = float(os.environ.get('PANEL_GUTTER_INK_FRACTION', 0.0))
+# Gutters narrower than this fraction of the dimension are treated as spacing inside a chart
+MIN_GUTTER_FRACTION = float(os.environ.get('PANEL_MIN_GUTTER_FRACTION', 0.015))
+# Panels smaller than this fraction of the page in either dimension are dropped (legends, captions)
+MIN_PANEL_FRACTION = float(os.environ.get('PANEL_MIN_PANEL_FRACTION', 0.12))
+# How many alternating horizontal/vertical cuts to make (2 handles regular grids)
+MAX_SPLIT_DEPTH = 4
+# More panels than this means the cut went inside charts; the image is then treated as one chart
+MAX_PANELS = 12
+
+
+def _background_mask(pixels):
+    """Boolean mask of pixels that differ from the page background"""
+    # The most common border value is a robust estimate of the background colour
+    border = np.concatenate([pixels[0, :], pixels[-1, :], pixels[:, 0], pixels[:, -1]])
+    values, counts = np.unique(border, return_counts=True)
+    background = int(values[np.argmax(counts)])
+    return np.abs(pixels.astype(np.int16) - background) > BACKGROUND_TOLERANCE
+
+
+def _segments(profile, length, min_gutter):
+    """
+    Split one axis at gutters in a projection profile
+
+    Args:
+        profile (np.ndarray): Fraction of ink per row (or column)
+        length (int): Size of the axis in pixels
+        min_gutter (int): Minimum gutter width in pixels
+
+    Returns:
+        list: (start, end) spans of content between gutters
+    """
+    empty = profile <= GUTTER_INK_FRACTION
+    spans = []
+    start = None
+    gap = 0
+    for i in range(length):
+        if empty[i]:
+            gap += 1
+            if start is not None and gap >= min_gutter:
+                spans.append((start, i - gap + 1))
+                start = None
+        else:
+            if start is None:
+                start = i
+            gap = 0
+    if start is not None:
+        end = length
+        while end > start and empty[end - 1]:
+            end -= 1
+        spans.append((start, end))
+    return spans
+
+
+def _cut(mask, x0, y0, axis, depth, min_size, min_gutter, boxes):
+    """Recursive XY-cut of a mask region, alternating axis at each level"""
+    height, width = mask.shape
+    for _ in range(2):
+        # Profile along the current axis: ink per row (axis 0) or per column (axis 1)
+        profile = mask.mean(axis=1 - axis)
+        length = height if axis == 0 else width
+        spans = _segments(profile, length, min_gutter[axis])
+        spans = [span for span in spans if span[1] - span[0] >= min_size[axis]]
+        if len(spans) > 1 or depth == 0:
+            break
+        # No split on this axis; try the other one before giving up
+        axis = 1 - axis
+    if len(spans) <= 1 or depth == 0:
+        # Tighten the box to its content
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if rows.size and cols.size:
+            boxes.append((x0 + int(cols[0]), y0 + int(rows[0]), x0 + int(cols[-1]) + 1, y0 + int(rows[-1]) + 1))
+        return
+    for start, end in spans:
+        if axis == 0:
+            _cut(mask[start:end, :], x0, y0 + start, 1, depth - 1, min_size, min_gutter, boxes)
+        else:
+            _cut(mask[:, start:end], x0 + start, y0, 0, depth - 1, min_size, min_gutter, boxes)
+
+
+def detect_panels(image, padding=4):
+    """
+    Find the bounding boxes of the individual charts in a dashboard image
+
+    Runs a recursive XY-cut: rows (then columns) whose ink fraction stays near
+    zero for long enough form gutters, and the content between gutters becomes
+    a panel. A single-chart image yields one box covering its content.
+
+    Args:
+        image (PIL.Image.Image): Dashboard image
+        padding (int): Pixels of margin kept around each panel
+
+    Returns:
+        list: (left, top, right, bottom) boxes in reading order
+    """
+    pixels = np.asarray(image.convert('L'))
+    height, width = pixels.shape
+    mask = _background_mask(pixels)
+    min_size = (max(1, int(height * MIN_PANEL_FRACTION)), max(1, int(width * MIN_PANEL_FRACTION)))
+    min_gutter = (max(2, int(height * MIN_GUTTER_FRACTION)), max(2, int(width * MIN_GUTTER_FRACTION)))
+
+    boxes = []
+    _cut(mask, 0, 0, 0, MAX_SPLIT_DEPTH, min_size, min_gutter, boxes)
+    if not boxes or len(boxes) > MAX_PANELS:
+        return [(0, 0, width, height)]
+
+    padded = [
+        (max(0, left - padding), max(0, top - padding), min(width, right + padding), min(height, bottom + padding))
+        for left, top, right, bottom in boxes
+    ]
+    # Reading order: top to bottom, then left to right
+    return sorted(padded, key=lambda box: (box[1], box[0]))
+
+
+def extract_tables_from_dashboard(image_source, profile=None, timings=None):
+    """
+    Extract one table per chart panel of a dashboard image
+
+    All panel crops are submitted to the micro-batcher together, so they are
+    decoded as one batch of short generations instead of one long one.
+
+    Args:
+        image_source: Path, bytes, file-like object or PIL image
+        profile (str): Generation profile name; the default profile if None
+        timings (dict): Optional dict that receives decode_ms, detect_ms, generate_ms and parse_ms
+
+    Returns:
+        list: One dict per panel with bbox, title, headers, data, formatted_table and raw_text
+    """
+    start = time.monotonic()
+    image = load_image(image_source)
+    decoded = time.monotonic()
+    boxes = detect_panels(image)
+    detected = time.monotonic()
+    logger.info(f"Detected {len(boxes)} chart panels")
+
+    futures = [batcher.submit(image.crop(box), profile=profile) for box in boxes]
+    raw_outputs = [future.result() for future in futures]
+    generated = time.monotonic()
+
+    panels = []
+    for box, raw_output in zip(boxes, raw_outputs):
+        table = parse_table_output(raw_output)
+        panels.append({
+            "bbox": list(box),
+            "title": table.title,
+            "headers": table.headers,
+            "data": table.data,
+            "formatted_table": table.formatted_table,
+            "raw_text": table.raw_output
+        })
+    if timings is not None:
+        timings['decode_ms'] = (decoded - start) * 1000.0
+        timings['detect_ms'] = (detected - decoded) * 1000.0
+        timings['generate_ms'] = (generated - detected) * 1000.0
+        timings['parse_ms'] = (time.monotonic() - generated) * 1000.0
+    return panels
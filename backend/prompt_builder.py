@@ -0,0 +1,173 @@
+"""
+Prompt builder - Builds Ollama prompts for chart questions within a token budget, compacting
+the table and keeping only the rows and columns relevant to the question when it is too large
+"""
+
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Token budget for the whole prompt (instructions, title, question and table)
+PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', 1536))
+# The table always gets at least this many tokens, even when the question is long
+MIN_TABLE_TOKENS = 64
+# Average characters per token for Llama-family tokenizers on English and numbers
+CHARS_PER_TOKEN = 4.0
+
+# Bumped whenever the prompt text changes, so cached answers built from old prompts are not reused
+PROMPT_TEMPLATE_VERSION = 1
+
+VISUAL_QUESTION = re.compile(r"colou?rs?|visual|appearance|style|design|scheme", re.IGNORECASE)
+WORD = re.compile(r"\w+")
+SEPARATOR_CELL = re.compile(r"^:?-{2,}:?$")
+
+# Instruction blocks, built once at import; only the title, table and question vary per call
+VISUAL_INSTRUCTIONS = """
+IMPORTANT: Your task is to analyze the visual elements of this chart, with special attention to colors. Please provide:
+1. A detailed description of all colors used in the chart
+2. What each color represents in the context of the data
+3. How colors are used to distinguish between different data points, categories, or values
+4. Any color patterns, gradients, or visual indicators of importance
+5. How effectively the color scheme communicates the data
+
+Focus primarily on the VISUAL APPEARANCE rather than just the numeric data."""
+
+DEFAULT_INSTRUCTIONS = """
+Please provide a detailed answer based on the data and question above. When relevant, include observations about the visual elements of the chart, including colors and design."""
+
+TEMPLATE_PARTS = ("Title: ", "\nData: ", "\nQuestion: ", "\n")
+
+
+def estimate_tokens(text):
+    """Approximate token count of text (no tokenizer round trip)"""
+    return int(len(text) / CHARS_PER_TOKEN + 0.999)
+
+
+_FIXED_TOKENS = {
+    'visual': estimate_tokens(''.join(TEMPLATE_PARTS) + VISUAL_INSTRUCTIONS),
+    'default': estimate_tokens(''.join(TEMPLATE_PARTS) + DEFAULT_INSTRUCTIONS),
+}
+
+
+def parse_rows(table_data):
+    """
+    Split raw DePlot output or a pipe/markdown table into rows of stripped cells
+
+    Markdown separator rows (|---|---|) and empty rows are dropped.
+    """
+    text = table_data.replace('<0x0A>', '\n')
+    rows = []
+    for line in text.splitlines():
+        if '|' not in line:
+            if line.strip():
+                rows.append([line.strip()])
+            continue
+        cells = [cell.strip() for cell in line.split('|')]
+        # Leading/trailing pipes of markdown tables produce empty edge cells
+        if cells and not cells[0]:
+            cells = cells[1:]
+        if cells and not cells[-1]:
+            cells = cells[:-1]
+        if not cells or all(SEPARATOR_CELL.match(cell) for cell in cells):
+            continue
+        rows.append(cells)
+    return rows
+
+
+def compact_table(rows):
+    """Render rows with the fewest delimiters: one line per row, cells joined by '|'"""
+    return '\n'.join('|'.join(row) for row in rows)
+
+
+def _mentioned(words, cell):
+    """Whether every word of a cell appears in the question"""
+    cell_words = WORD.findall(cell.lower())
+    return bool(cell_words) and all(word in words for word in cell_words)
+
+
+def select_relevant(rows, question, budget):
+    """
+    Reduce a table to the rows and columns the question refers to, within budget tokens
+
+    The title row, the header row and the first (label) column are always kept.
+    Columns named in the question are kept (all columns if none is named). Rows
+    whose label is named come first; remaining rows fill the budget in table
+    order. Rows keep their original order in the output.
+
+    Returns:
+        tuple: (rows, number of data rows dropped)
+    """
+    head = []
+    if rows and rows[0] and rows[0][0].upper().startswith('TITLE'):
+        head.append(rows[0])
+        rows = rows[1:]
+    if len(rows) < 2:
+        return head + rows, 0
+    header, body = rows[0], rows[1:]
+    words = set(WORD.findall(question.lower()))
+
+    columns = [i for i, name in enumerate(header) if i > 0 and _mentioned(words, name)]
+    if columns:
+        keep = [0] + columns
+        header = [header[i] for i in keep]
+        body = [[row[i] for i in keep if i < len(row)] for row in body]
+
+    used = estimate_tokens(compact_table(head + [header]))
+    named = [i for i, row in enumerate(body) if row and _mentioned(words, row[0])]
+    named_set = set(named)
+    order = named + [i for i in range(len(body)) if i not in named_set]
+    chosen = set()
+    for i in order:
+        cost = estimate_tokens(compact_table([body[i]])) + 1
+        if used + cost > budget and chosen:
+            break
+        chosen.add(i)
+        used += cost
+    kept = [body[i] for i in sorted(chosen)]
+    return head + [header] + kept, len(body) - len(kept)
+
+
+def fit_table(table_data, question, budget):
+    """
+    Fit table_data into budget tokens
+
+    Returns:
+        str: The table text as it should appear in the prompt
+    """
+    if estimate_tokens(table_data) <= budget:
+        return table_data
+    rows = parse_rows(table_data)
+    compact = compact_table(rows)
+    if estimate_tokens(compact) <= budget:
+        return compact
+    selected, dropped = select_relevant(rows, question, budget)
+    logger.info(f"Prompt table over budget ({estimate_tokens(compact)} > {budget} tokens); "
+                f"kept {len(selected)} rows, dropped {dropped}")
+    text = compact_table(selected)
+    if dropped:
+        text += f"\n({dropped} more rows not shown)"
+    return text
+
+
+def build_prompt(question, table_data="", title="", budget=None):
+    """
+    Build the Ollama prompt for a question about chart data
+
+    Args:
+        question (str): User question
+        table_data (str): Raw DePlot output or pipe table
+        title (str): Chart title
+        budget (int): Prompt token budget; PROMPT_TOKEN_BUDGET if None
+
+    Returns:
+        str: The prompt
+    """
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    kind = 'visual' if VISUAL_QUESTION.search(question) else 'default'
+    instructions = VISUAL_INSTRUCTIONS if kind == 'visual' else DEFAULT_INSTRUCTIONS
+    table_budget = max(MIN_TABLE_TOKENS, budget - _FIXED_TOKENS[kind] - estimate_tokens(question) - estimate_tokens(title))
+    table = fit_table(table_data, question, table_budget) if table_data else table_data
+    title_label, data_label, question_label, end = TEMPLATE_PARTS
+    return ''.join((title_label, title, data_label, table, question_label, question, end, instructions))
@@ -0,0 +1,265 @@
+"""
+Query engine - Answers simple numeric questions about an extracted table (max, min, sum,
+average, count, difference, trend, lookup) with pandas, without calling the LLM
+"""
+
+import re
+import math
+import logging
+from collections import namedtuple
+
+from chart_analyzer import parse_table_output
+from table import ChartTable
+
+logger = logging.getLogger(__name__)
+
+# Result of a deterministic answer; intent names the rule that matched
+QueryAnswer = namedtuple('QueryAnswer', ['answer', 'intent'])
+
+# Questions asking for explanation or visual analysis always go to the LLM
+OPEN_ENDED = re.compile(r"\b(why|explain|describe|summar\w*|insight\w*|analy\w*|colou?r\w*|visual\w*|design|style|predict\w*|recommend\w*|compare)\b")
+
+DIFFERENCE = re.compile(r"\bdifference between (?P<a>.+?) and (?P<b>.+?)[?.!]*$")
+
+# Comparisons, thresholds, ranges and yes/no questions: a plain max, sum or lookup would be a
+# confident wrong answer to these, so they go to the LLM
+QUALIFIED = re.compile(
+    r"\b(than|at least|at most|between|versus|vs)\b"
+    r"|\bfrom\b.+\bto\b"
+    r"|\b(above|below|over|under|exceed\w*)\s+[-+$€£¥]?\d"
+    r"|^(is|are|was|were|does|do|did|has|have|can)\b"
+)
+
+COUNT = re.compile(r"\b(?:how many|number of) (rows|categories|items|entries|years|data points|bars|points)\b")
+# Other counting questions ("total number of sales") are never sums or extremes
+COUNTING = re.compile(r"\b(how many|number of|count of)\b")
+
+INTENTS = [
+    ('max', re.compile(r"\b(highest|largest|maximum|max|biggest|greatest|peak|most|top)\b")),
+    ('min', re.compile(r"\b(lowest|smallest|minimum|min|least|fewest|bottom)\b")),
+    ('average', re.compile(r"\b(average|mean)\b")),
+    ('sum', re.compile(r"\b(sum|total)\b")),
+    # "How much did X increase" asks for an amount, not the overall trend
+    ('trend', re.compile(r"^(?!.*\bhow much\b).*\b(trend|increas\w*|decreas\w*|grow\w*|declin\w*)\b")),
+    ('lookup', re.compile(r"\b(what is|what was|what's|value of|value for)\b")),
+]
+
+
+def table_to_dataframe(table_data):
+    """
+    Build a typed DataFrame from raw DePlot output or a pipe/markdown table
+
+    The first column (DePlot's x-axis categories) becomes the row label index;
+    the other columns keep the types ChartTable parsed them into.
+
+    Returns:
+        tuple: (title, DataFrame) or (title, None) if no usable table was found
+    """
+    text = table_data.replace('\r\n', '\n').replace('\n', '<0x0A>')
+    # parse_table_output reads the first line as the title; plain pipe tables start with headers
+    if 'TITLE' not in text.split('<0x0A>', 1)[0].upper():
+        text = 'TITLE | Chart<0x0A>' + text
+    table = parse_table_output(text)
+    title, headers = table.title, table.headers
+    # Drop markdown separator rows such as |---|---|
+    data = [row for row in table.data if not all(set(cell) <= set('-: ') for cell in row)]
+    if not data or not headers:
+        return title, None
+    if len(data) != len(table.data):
+        table = ChartTable(title, headers, data, table.raw_output)
+
+    # Unique, non-empty column names
+    columns = []
+    for i, header in enumerate(headers):
+        name = header or f"Column {i + 1}"
+        columns.append(name if name not in columns else f"{name} ({i + 1})")
+    if len(columns) < 2:
+        return title, None
+
+    # pandas is imported on first use to keep server startup fast
+    import pandas as pd
+
+    # Numeric columns arrive as float arrays, so cells are not parsed a second time here
+    index = pd.Index([row[0] for row in data], name=columns[0])
+    frame = pd.DataFrame(dict(zip(columns[1:], table.columns[1:])), index=index)
+    if frame.select_dtypes('number').empty:
+        return title, None
+    return title, frame
+
+
+def _format(value):
+    if math.isnan(value):
+        return "n/a"
+    if float(value).is_integer():
+        return f"{int(value):,}"
+    return f"{value:,.2f}".rstrip('0').rstrip('.')
+
+
+def _mentions(question, name):
+    return re.search(r"(?<!\w)" + re.escape(str(name).lower()) + r"(?!\w)", question) is not None
+
+
+def _value_column(question, frame):
+    """Numeric column named in the question, or the only numeric column"""
+    numeric = list(frame.select_dtypes('number').columns)
+    named = [column for column in numeric if _mentions(question, column)]
+    if len(named) == 1:
+        return named[0]
+    if len(numeric) == 1:
+        return numeric[0]
+    return None
+
+
+def _unique(frame, label):
+    """Whether label names exactly one row; repeated labels are ambiguous"""
+    return (frame.index == label).sum() == 1
+
+
+def _row_label(question, frame):
+    """Row label mentioned in the question (the longest match wins), or None if it names several rows"""
+    labels = [label for label in frame.index.unique() if str(label).strip() and _mentions(question, label)]
+    if not labels:
+        return None
+    label = max(labels, key=lambda label: len(str(label)))
+    return label if _unique(frame, label) else None
+
+
+def _find_row(frame, text):
+    text = text.strip().strip('"\'').lower()
+    for label in frame.index.unique():
+        if str(label).strip().lower() == text:
+            return label if _unique(frame, label) else None
+    return None
+
+
+def _extreme(frame, question, largest):
+    column = _value_column(question, frame)
+    if column is None:
+        return None
+    series = frame[column].dropna()
+    if series.empty:
+        return None
+    label = series.idxmax() if largest else series.idxmin()
+    value = series.max() if largest else series.min()
+    word = "highest" if largest else "lowest"
+    return f"The {word} {column} is {_format(value)} ({label})."
+
+
+def _aggregate(frame, question, kind):
+    row = _row_label(question, frame)
+    column = _value_column(question, frame)
+    # A named column wins; otherwise a named row is aggregated across its numeric cells
+    if column is not None and (row is None or _mentions(question, column)):
+        values = frame[column].dropna()
+        scope = column
+    elif row is not None:
+        values = frame.loc[[row]].select_dtypes('number').iloc[0].dropna()
+        scope = row
+    else:
+        return None
+    if values.empty:
+        return None
+    if kind == 'sum':
+        return f"The total of {scope} is {_format(values.sum())}."
+    return f"The average of {scope} is {_format(values.mean())}."
+
+
+def _difference(frame, question, match):
+    first, second = _find_row(frame, match.group('a')), _find_row(frame, match.group('b'))
+    column = _value_column(question, frame)
+    if first is None or second is None or column is None:
+        return None
+    a, b = frame.at[first, column], frame.at[second, column]
+    if math.isnan(a) or math.isnan(b):
+        return None
+    return (f"The difference in {column} between {first} ({_format(a)}) and "
+            f"{second} ({_format(b)}) is {_format(abs(a - b))}.")
+
+
+def _trend(frame, question):
+    # A question naming one row ("what was the growth in 2019?") asks for a cell, left to _lookup
+    if _row_label(question, frame) is not None:
+        return None
+    column = _value_column(question, frame)
+    if column is None:
+        return None
+    series = frame[column].dropna()
+    if len(series) < 2:
+        return None
+    first, last = series.iloc[0], series.iloc[-1]
+    steps = series.diff().dropna()
+    if (steps >= 0).all():
+        shape = "increases steadily"
+    elif (steps <= 0).all():
+        shape = "decreases steadily"
+    else:
+        shape = "increases overall" if last > first else "decreases overall" if last < first else "ends where it started"
+    change = f" ({(last - first) / abs(first) * 100:+.1f}%)" if first else ""
+    return (f"{column} {shape}, from {_format(first)} ({series.index[0]}) to "
+            f"{_format(last)} ({series.index[-1]}){change}.")
+
+
+def _lookup(frame, question):
+    row = _row_label(question, frame)
+    column = _value_column(question, frame)
+    if row is None or column is None:
+        return None
+    value = frame.at[row, column]
+    if math.isnan(value):
+        return None
+    return f"The {column} for {row} is {_format(value)}."
+
+
+def answer_question(question, table_data):
+    """
+    Try to answer a question from the table alone
+
+    Args:
+        question (str): User question
+        table_data (str): Raw DePlot output or pipe table
+
+    Returns:
+        QueryAnswer or None: None when no intent matches or the table does not fit it
+    """
+    question = question.strip().lower()
+    if not question or OPEN_ENDED.search(question):
+        return None
+    # Any failure (unparseable table, odd cell types, ...) just leaves the question to the LLM
+    try:
+        title, frame = table_to_dataframe(table_data)
+        if frame is None:
+            return None
+        return _dispatch(frame, question)
+    except Exception as e:
+        logger.debug(f"Query engine could not answer: {str(e)}")
+        return None
+
+
+def _dispatch(frame, question):
+    """Match the question against the intents in order; None if none fits unambiguously"""
+    match = DIFFERENCE.search(question)
+    if match:
+        answer = _difference(frame, question, match)
+        return QueryAnswer(answer, 'difference') if answer is not None else None
+    if QUALIFIED.search(question):
+        return None
+    match = COUNT.search(question)
+    if match:
+        return QueryAnswer(f"There are {len(frame)} {match.group(1)} in the chart.", 'count')
+    if COUNTING.search(question):
+        return None
+
+    for intent, pattern in INTENTS:
+        if not pattern.search(question):
+            continue
+        if intent in ('max', 'min'):
+            answer = _extreme(frame, question, largest=intent == 'max')
+        elif intent in ('sum', 'average'):
+            answer = _aggregate(frame, question, intent)
+        elif intent == 'trend':
+            answer = _trend(frame, question)
+        else:
+            answer = _lookup(frame, question)
+        if answer is not None:
+            return QueryAnswer(answer, intent)
+    return None
@@ -0,0 +1,254 @@
+"""
+Prefork server - Production entry point that loads DePlot once in a master process and
+forks worker processes that share its weights copy-on-write
+
+The master binds the listening socket, preloads the model with torch limited to one
+thread, freezes the garbage collector's view of the loaded objects and forks. Each
+worker sizes its own torch thread pool (cores / workers by default), warms the model
+up and serves the Flask app on the shared socket with a threaded WSGI server. The
+master restarts workers that exit and logs RSS/PSS/USS of every process from /proc.
+
+Usage:
+    python serve_prefork.py [--host 0.0.0.0] [--port 5000] [--workers 4] [--torch-threads 2]
+"""
+
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+import threading
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(name)s %(levelname)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+CPU_COUNT = os.cpu_count() or 1
+
+# Serving configuration, overridable through the environment
+PREFORK_HOST = os.environ.get('PREFORK_HOST', '0.0.0.0')
+PREFORK_PORT = int(os.environ.get('PREFORK_PORT', 5000))
+PREFORK_WORKERS = int(os.environ.get('PREFORK_WORKERS', max(1, CPU_COUNT // 2)))
+PREFORK_TORCH_THREADS = int(os.environ.get('PREFORK_TORCH_THREADS', 0))  # 0: cores / workers
+PREFORK_BACKLOG = int(os.environ.get('PREFORK_BACKLOG', 128))
+PREFORK_GRACEFUL_TIMEOUT = float(os.environ.get('PREFORK_GRACEFUL_TIMEOUT', 30))
+PREFORK_MEMORY_LOG_INTERVAL = float(os.environ.get('PREFORK_MEMORY_LOG_INTERVAL', 300))  # 0 disables
+
+# Minimum seconds between restarts of one worker slot, so a crashing worker cannot fork-bomb
+RESTART_DELAY = 1.0
+
+MEMORY_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def read_memory(pid='self'):
+    """
+    Memory of one process from /proc, in MB
+
+    PSS (proportional set size) charges each shared page to its sharers in equal
+    parts, so summing PSS over the master and workers gives the real total. USS
+    (private clean + dirty) is what a process would free on exit: the marginal
+    cost of one more worker.
+
+    Returns:
+        dict: rss_mb, pss_mb, shared_mb and uss_mb, or None if /proc is unavailable
+    """
+    values = {}
+    try:
+        # smaps_rollup (Linux 4.14+) is the cheap pre-summed form of smaps
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in MEMORY_FIELDS:
+                    values[name] = int(rest.split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    kb = lambda *names: sum(values.get(name, 0) for name in names)
+    return {
+        "rss_mb": round(kb('Rss') / 1024.0, 1),
+        "pss_mb": round(kb('Pss') / 1024.0, 1),
+        "shared_mb": round(kb('Shared_Clean', 'Shared_Dirty') / 1024.0, 1),
+        "uss_mb": round(kb('Private_Clean', 'Private_Dirty') / 1024.0, 1)
+    }
+
+
+def log_memory(workers):
+    """Log RSS/PSS/USS of the master and every worker, and the totals"""
+    report = {'master': read_memory()}
+    for pid, slot in sorted(workers.items(), key=lambda item: item[1]):
+        report[f'worker-{slot}'] = read_memory(pid)
+    if any(memory is None for memory in report.values()):
+        logger.info("Memory: /proc/<pid>/smaps_rollup is not available on this system")
+        return
+    for name, memory in report.items():
+        logger.info(f"Memory {name}: rss={memory['rss_mb']} MB pss={memory['pss_mb']} MB "
+                    f"shared={memory['shared_mb']} MB uss={memory['uss_mb']} MB")
+    worker_memory = [memory for name, memory in report.items() if name != 'master']
+    total_pss = sum(memory['pss_mb'] for memory in report.values())
+    total_rss = sum(memory['rss_mb'] for memory in report.values())
+    avg_uss = sum(memory['uss_mb'] for memory in worker_memory) / len(worker_memory) if worker_memory else 0.0
+    logger.info(f"Memory total: pss={total_pss:.1f} MB (rss sum {total_rss:.1f} MB) across master + "
+                f"{len(worker_memory)} workers; each extra worker costs about {avg_uss:.1f} MB (avg uss)")
+
+
+def bind_socket(host, port, backlog=PREFORK_BACKLOG):
+    """Listening socket created in the master and inherited by every worker"""
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    # Non-blocking, so workers that lose the race for a connection go back to select()
+    # instead of blocking in accept(); accepted connections are blocking again
+    sock.setblocking(False)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload_model():
+    """
+    Load DePlot in the master before forking
+
+    torch runs single-threaded here: an OpenMP thread pool started before fork()
+    does not exist in the children and can hang their first parallel region.
+    Each worker sizes its own pool after the fork.
+    """
+    import torch
+    from model_registry import registry
+
+    torch.set_num_threads(1)
+    start = time.perf_counter()
+    registry.preload()
+    logger.info(f"Master loaded {registry.model_id} ({registry.mode}) in {time.perf_counter() - start:.1f}s")
+
+
+def run_worker(sock, slot, host, port):
+    """Body of a forked worker: warm the shared model up and serve until SIGTERM"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    gc.enable()
+
+    from werkzeug.serving import make_server
+    from app import app
+    from startup import startup_monitor
+    from ollama_health import health_monitor
+
+    # Sizes torch's threads for this worker, then warms up; the weights are already loaded
+    health_monitor.start()
+    startup_monitor.start()
+
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    # shutdown() waits for serve_forever() to return, so it must run on another thread
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start())
+    logger.info(f"Worker {slot} serving on {host}:{port}")
+    server.serve_forever()
+    logger.info(f"Worker {slot} stopped")
+
+
+def spawn_worker(sock, slot, host, port):
+    """Fork one worker; returns its pid in the master"""
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(sock, slot, host, port)
+        except Exception as e:
+            logger.error(f"Worker {slot} failed: {str(e)}")
+            code = 1
+        finally:
+            # Never fall back into the master's loop or run its atexit handlers
+            os._exit(code)
+    return pid
+
+
+def supervise(sock, host, port, num_workers):
+    """Fork the workers, restart any that exit, and stop them all on SIGTERM/SIGINT"""
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    workers = {}
+    last_spawn = {}
+    for slot in range(num_workers):
+        workers[spawn_worker(sock, slot, host, port)] = slot
+        last_spawn[slot] = time.monotonic()
+    logger.info(f"Master {os.getpid()} forked {num_workers} workers")
+
+    next_memory_log = time.monotonic() + min(60.0, PREFORK_MEMORY_LOG_INTERVAL or 60.0)
+    while not stopping.is_set():
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid and pid in workers:
+            slot = workers.pop(pid)
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            logger.warning(f"Worker {slot} (pid {pid}) exited with status {code}, restarting")
+            time.sleep(max(0.0, last_spawn[slot] + RESTART_DELAY - time.monotonic()))
+            workers[spawn_worker(sock, slot, host, port)] = slot
+            last_spawn[slot] = time.monotonic()
+            continue
+        if PREFORK_MEMORY_LOG_INTERVAL > 0 and time.monotonic() >= next_memory_log:
+            log_memory(workers)
+            next_memory_log = time.monotonic() + PREFORK_MEMORY_LOG_INTERVAL
+        stopping.wait(0.5)
+
+    logger.info(f"Stopping {len(workers)} workers")
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + PREFORK_GRACEFUL_TIMEOUT
+    while workers and time.monotonic() < deadline:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            workers.pop(pid, None)
+        else:
+            time.sleep(0.1)
+    for pid in workers:
+        logger.warning(f"Worker pid {pid} did not stop in {PREFORK_GRACEFUL_TIMEOUT:g}s, killing it")
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the app from forked workers sharing one preloaded DePlot model")
+    parser.add_argument('--host', default=PREFORK_HOST)
+    parser.add_argument('--port', type=int, default=PREFORK_PORT)
+    parser.add_argument('--workers', type=int, default=PREFORK_WORKERS)
+    parser.add_argument('--torch-threads', type=int, default=PREFORK_TORCH_THREADS,
+                        help="Torch intra-op threads per worker (default: cores / workers)")
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, 'fork'):
+        logger.error("Prefork serving needs os.fork(); run app.py directly on this platform")
+        return 1
+    workers = max(1, args.workers)
+    torch_threads = args.torch_threads or max(1, CPU_COUNT // workers)
+
+    # Read by model_registry on import, and applied in each worker by the startup monitor
+    os.environ['DEPLOT_NUM_THREADS'] = str(torch_threads)
+    os.environ.setdefault('DEPLOT_NUM_INTEROP_THREADS', '1')
+
+    # Keep the collector from touching (and so copying) the preloaded objects' pages:
+    # disable it while loading, then move everything that survived into the permanent generation
+    gc.disable()
+    from startup import startup_monitor, STARTED_AT
+
+    sock = bind_socket(args.host, args.port)
+    import app  # noqa: F401 - imported once here so workers inherit the loaded modules
+    startup_monitor.mark('app_imports', STARTED_AT)
+    if startup_monitor.preload:
+        preload_model()
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Forking {workers} workers with {torch_threads} torch threads each on {CPU_COUNT} cores")
+
+    supervise(sock, args.host, args.port, workers)
+    sock.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Session store - Conversation state for /api/generate, kept in a bounded in-memory LRU with
+an idle TTL, or in SQLite so it survives restarts and is shared between worker processes
+"""
+
+import os
+import sys
+import asyncio
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager, asynccontextmanager
+
+from cache import LRUCache, SQLiteCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+# Store configuration, overridable through the environment
+SESSION_MAX = int(os.environ.get('SESSION_MAX', 1000))
+SESSION_TTL = int(os.environ.get('SESSION_TTL', 3600))  # Idle seconds before a session is forgotten
+SESSION_DB_PATH = os.environ.get('SESSION_DB') or None
+# Expired rows are purged from SQLite at most this often, in seconds
+PURGE_INTERVAL = 60
+
+
+def new_session():
+    """Empty session: text history, Ollama's token context and the model that produced it"""
+    return {"history": [], "context": None, "model": None}
+
+
+class SessionStore:
+    """
+    Thread-safe store of conversation sessions keyed by session id.
+
+    Callers hold lock(session_id) for a whole turn (load, generate, save), so
+    concurrent requests in one session run one after the other instead of
+    interleaving their history. Locks are per session and are dropped once no
+    request holds or waits for them, so different sessions never block each
+    other. With a SQLite path the database is the only tier; the per-session
+    lock still only orders requests within one process.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX, ttl=SESSION_TTL, db_path=SESSION_DB_PATH):
+        self.ttl = ttl
+        self.memory = None
+        self.disk = None
+        if db_path:
+            try:
+                self.disk = SQLiteCache(db_path, table='sessions', ttl=ttl)
+            except sqlite3.Error as e:
+                logger.warning(f"SQLite session store disabled, keeping sessions in memory: {str(e)}")
+        if self.disk is None:
+            self.memory = LRUCache(max_sessions, ttl)
+
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._async_locks = {}
+        self._stats_lock = threading.Lock()
+        self._last_purge = time.monotonic()
+        self._counters = {'hits': 0, 'misses': 0, 'saves': 0, 'deletes': 0, 'purged': 0, 'lock_waits': 0, 'errors': 0}
+
+    @contextmanager
+    def lock(self, session_id):
+        """Hold the session's lock for the duration of a turn"""
+        with self._locks_lock:
+            entry = self._locks.get(session_id)
+            if entry is None:
+                entry = self._locks[session_id] = [threading.Lock(), 0]
+            entry[1] += 1
+        lock = entry[0]
+        if not lock.acquire(blocking=False):
+            self._count('lock_waits')
+            lock.acquire()
+        try:
+            yield
+        finally:
+            lock.release()
+            with self._locks_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[session_id]
+
+    @asynccontextmanager
+    async def async_lock(self, session_id):
+        """asyncio counterpart of lock() for the ASGI app; use it from a single event loop"""
+        entry = self._async_locks.get(session_id)
+        if entry is None:
+            entry = self._async_locks[session_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        lock = entry[0]
+        if lock.locked():
+            self._count('lock_waits')
+        try:
+            async with lock:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._async_locks[session_id]
+
+    def load(self, session_id):
+        """
+        Return the stored session, or a new empty one if it is unknown or expired
+
+        The returned dict is a copy; changes are kept only once passed to save().
+        """
+        try:
+            value = self.disk.get(session_id) if self.disk is not None else self.memory.get(session_id)
+        except sqlite3.Error as e:
+            logger.warning(f"Session read failed: {str(e)}")
+            self._count('errors')
+            value = MISSING
+        if value is MISSING:
+            self._count('misses')
+            return new_session()
+        self._count('hits')
+        session = dict(value)
+        session['history'] = list(session['history'])
+        return session
+
+    def save(self, session_id, session):
+        """Store a session, restarting its idle TTL"""
+        if self.disk is not None:
+            try:
+                self.disk.set(session_id, session)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.warning(f"Session write failed: {str(e)}")
+                self._count('errors')
+                return
+            self._purge_if_due()
+        else:
+            self.memory.set(session_id, session)
+        self._count('saves')
+
+    def delete(self, session_id):
+        """Forget a session"""
+        if self.disk is not None:
+            self.disk.delete(session_id)
+        else:
+            self.memory.delete(session_id)
+        self._count('deletes')
+
+    def stats(self):
+        """Session count, approximate memory use, evictions and hit rate"""
+        with self._stats_lock:
+            stats = dict(self._counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        with self._locks_lock:
+            stats['active_locks'] = len(self._locks) + len(self._async_locks)
+        stats['backend'] = 'sqlite' if self.disk is not None else 'memory'
+        stats['ttl'] = self.ttl
+        if self.disk is not None:
+            stats['sessions'] = len(self.disk)
+            stats['evictions'] = stats['purged']
+        else:
+            sessions = self.memory.values()
+            stats['sessions'] = len(sessions)
+            stats['max_sessions'] = self.memory.max_entries
+            stats['evictions'] = self.memory.evictions
+            stats['context_tokens'] = sum(len(session['context'] or ()) for session in sessions)
+            stats['approx_bytes'] = sum(_session_size(session) for session in sessions)
+        return stats
+
+    def _purge_if_due(self):
+        now = time.monotonic()
+        if now - self._last_purge < PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        try:
+            purged = self.disk.purge_expired()
+        except sqlite3.Error as e:
+            logger.warning(f"Session purge failed: {str(e)}")
+            return
+        if purged:
+            logger.info(f"Purged {purged} expired sessions")
+            self._count('purged', purged)
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._counters[name] += amount
+
+
+def _session_size(session):
+    """Rough in-memory size of a session: history strings plus one Python int per context token"""
+    size = sum(sys.getsizeof(message) for message in session['history'])
+    context = session['context'] or ()
+    return size + sys.getsizeof(context) + 28 * len(context)
+
+
+# Process-wide session store
+session_store = SessionStore()
@@ -0,0 +1,133 @@
+"""
+Single-flight module - Coalesces identical in-flight calls so that only one of them
+does the work and the others wait for its result
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """One in-flight call shared by a leader and any number of followers"""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Duplicate call suppression keyed on an arbitrary hashable key.
+
+    The first caller for a key (the leader) runs the function; callers arriving
+    while it runs (followers) block until it finishes and receive the same
+    result, or have the leader's exception raised in their own thread.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {'leaders': 0, 'followers': 0, 'errors': 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) unless an identical call is already in flight
+
+        Args:
+            key: Hashable identity of the call
+            fn (callable): Work to run if this caller becomes the leader
+
+        Returns:
+            The leader's return value
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._counters['leaders'] += 1
+            else:
+                self._counters['followers'] += 1
+
+        if not leader:
+            logger.debug(f"Coalescing duplicate '{self.name}' request")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._counters['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """Return leader/follower counters and the number of calls in flight"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = len(self._calls)
+        return stats
+
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    asyncio counterpart of SingleFlight for coroutine functions.
+
+    The shared call runs as its own task, so a caller that is cancelled (for
+    example because its client disconnected) stops waiting without cancelling
+    the call for everyone else. Use it from a single event loop.
+    """
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        Await fn(*args, **kwargs) unless an identical call is already in flight
+
+        Returns:
+            The shared call's return value
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = task
+            self._counters['leaders'] += 1
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            logger.debug(f"Coalescing duplicate '{self.name}' request")
+            self._counters['followers'] += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        self._calls.pop(key, None)
+        # Retrieving the exception also stops asyncio warning about it when nobody waited
+        if task.cancelled() or task.exception() is not None:
+            self._counters['errors'] += 1
+
+
+def question_key(question, table_data, title, model):
+    """Key identifying an LLM question against a specific table and model"""
+    payload = json.dumps([question, table_data, title, model])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Process-wide groups for chart extractions and LLM questions
+extraction_flight = SingleFlight('extract')
+question_flight = SingleFlight('question')
+question_async_flight = AsyncSingleFlight('question')
@@ -0,0 +1,113 @@
+"""
+Startup - Background model load and warmup, per-phase startup timings and the
+liveness/readiness state reported by /healthz and /readyz
+"""
+
+import os
+import threading
+import time
+import logging
+
+# Set when this module is first imported; app.py imports it before anything heavy
+STARTED_AT = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+# Startup configuration, overridable through the environment
+PRELOAD = os.environ.get('DEPLOT_PRELOAD', '1') != '0'
+WARMUP = os.environ.get('DEPLOT_WARMUP', '1') != '0'
+
+STARTING = 'starting'
+LOADING = 'loading'
+WARMING = 'warming'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class StartupMonitor:
+    """
+    Tracks startup phases and whether the server is ready for extraction traffic.
+
+    start() sizes torch's thread pools, loads DePlot and runs a short warmup
+    generate on a background thread, so the server answers liveness checks
+    immediately while torch is imported and the model loads.
+    With preloading disabled the server is ready at once and the model loads on
+    the first extraction instead.
+    """
+
+    def __init__(self, preload=PRELOAD, warmup=WARMUP):
+        self.preload = preload
+        self.warmup = warmup
+        self.state = STARTING
+        self.error = None
+        self.phases = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ready_at = None
+
+    def mark(self, phase, started_at):
+        """Record and log how long a startup phase took"""
+        elapsed_ms = (time.perf_counter() - started_at) * 1000.0
+        with self._lock:
+            self.phases[phase] = round(elapsed_ms, 1)
+        logger.info(f"Startup phase '{phase}' took {elapsed_ms:.0f} ms")
+
+    def start(self):
+        """Start loading and warming the model in the background (once)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="deplot-warmup", daemon=True)
+        self._thread.start()
+
+    @property
+    def started(self):
+        return self._thread is not None
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    def status(self):
+        """Readiness state, per-phase timings in ms and seconds since startup began"""
+        with self._lock:
+            phases = dict(self.phases)
+        status = {
+            "state": self.state,
+            "ready": self.ready,
+            "phases_ms": phases,
+            "uptime_s": round(time.perf_counter() - STARTED_AT, 1)
+        }
+        if self._ready_at is not None:
+            status["ready_after_s"] = round(self._ready_at - STARTED_AT, 1)
+        if self.error:
+            status["error"] = self.error
+        return status
+
+    def _run(self):
+        try:
+            started_at = time.perf_counter()
+            from model_registry import registry, configure_threads
+            configure_threads()
+            self.mark('torch_threads', started_at)
+            if self.preload:
+                self.state = LOADING
+                started_at = time.perf_counter()
+                registry.preload()
+                self.mark('model_load', started_at)
+                if self.warmup:
+                    self.state = WARMING
+                    started_at = time.perf_counter()
+                    registry.warmup()
+                    self.mark('warmup_generate', started_at)
+            self._ready_at = time.perf_counter()
+            self.state = READY
+            logger.info(f"Ready for extraction traffic {self._ready_at - STARTED_AT:.1f}s after startup began")
+        except Exception as e:
+            logger.error(f"Model startup failed: {str(e)}")
+            self.error = str(e)
+            self.state = FAILED
+
+
+# Process-wide startup monitor
+startup_monitor = StartupMonitor()
@@ -0,0 +1,179 @@
+"""
+Chart table - Typed, column-oriented view of an extracted table. Cells are parsed into
+NumPy columns once; grid, pipe and JSON renderings are built on first access
+"""
+
+import re
+import math
+from functools import cached_property
+
+import numpy as np
+from tabulate import tabulate
+
+# Optional currency, a number (with thousands separators and an optional exponent), then an
+# optional '%' or k/m/b(n) scale; the number must not run on into letters or digits ('12abc', '5 kg')
+NUMBER = re.compile(
+    r"^(?P<currency>[$€£¥])?\s*(?P<num>[-+]?(?:\d[\d,]*(?:\.\d+)?|\.\d+)(?:e[-+]?\d+)?)"
+    r"\s*(?P<suffix>%|[kmb]n?(?!\w))?(?!\w)",
+    re.IGNORECASE
+)
+SCALE = {'k': 1e3, 'm': 1e6, 'mn': 1e6, 'b': 1e9, 'bn': 1e9}
+
+# A column is numeric when at least this fraction of its non-empty cells parse as numbers
+NUMERIC_FRACTION = 0.8
+
+ORIENTS = ('rows', 'columns')
+
+
+def _parse_cell(value):
+    """Return (number, unit) for a cell such as '$3.5M' or '45%', or (None, None)"""
+    if value is None:
+        return None, None
+    match = NUMBER.match(str(value).strip())
+    if not match:
+        return None, None
+    number = float(match.group('num').replace(',', ''))
+    suffix = (match.group('suffix') or '').lower()
+    unit = '%' if suffix == '%' else match.group('currency') or None
+    return number * SCALE.get(suffix, 1.0), unit
+
+
+def parse_number(value):
+    """
+    Parse a table cell such as '1,200', '$3.5M', '45%' or '-2.1' into a float
+
+    Returns:
+        float or None: The number, or None if the cell is not numeric
+    """
+    return _parse_cell(value)[0]
+
+
+def _json_value(value):
+    """NaN becomes null so the payload stays valid JSON"""
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+class ChartTable:
+    """
+    An extracted table: title, headers, string rows and the raw model output.
+
+    Iterating yields the legacy (title, headers, data, formatted_table, raw_output)
+    tuple, so existing unpacking code keeps working; the grid table is only
+    rendered when it is actually unpacked or read.
+    """
+
+    def __init__(self, title, headers, data, raw_output):
+        self.title = title
+        self.headers = list(headers)
+        self.data = [list(row) for row in data]
+        self.raw_output = raw_output
+
+    @classmethod
+    def from_cache(cls, value):
+        """Rebuild a table from to_cache() output (or a legacy five-item extraction tuple)"""
+        if len(value) == 5:
+            title, headers, data, formatted_table, raw_output = value
+            table = cls(title, headers, data, raw_output)
+            table.__dict__['formatted_table'] = formatted_table
+            return table
+        return cls(*value)
+
+    def to_cache(self):
+        """Compact JSON-serializable form; renderings are rebuilt on demand"""
+        return [self.title, self.headers, self.data, self.raw_output]
+
+    def __iter__(self):
+        return iter((self.title, self.headers, self.data, self.formatted_table, self.raw_output))
+
+    @cached_property
+    def formatted_table(self):
+        """Grid rendering for display"""
+        return tabulate(self.data, headers=self.headers, tablefmt="grid")
+
+    @cached_property
+    def pipe_table(self):
+        """Pipe (markdown) rendering for LLM prompts"""
+        return tabulate(self.data, headers=self.headers, tablefmt="pipe")
+
+    @cached_property
+    def _typed_columns(self):
+        """Per column: (values, unit) where values is a float array for numeric columns"""
+        typed = []
+        for i in range(len(self.headers)):
+            cells = [row[i] if i < len(row) else '' for row in self.data]
+            parsed = [_parse_cell(cell) for cell in cells]
+            filled = [number for cell, (number, _) in zip(cells, parsed) if str(cell).strip()]
+            numeric = [number for number in filled if number is not None]
+            if filled and len(numeric) >= NUMERIC_FRACTION * len(filled):
+                values = np.array([np.nan if number is None else number for number, _ in parsed], dtype=float)
+                units = [unit for _, unit in parsed if unit]
+                unit = max(set(units), key=units.count) if units else None
+                typed.append((values, unit))
+            else:
+                typed.append((cells, None))
+        return typed
+
+    @property
+    def columns(self):
+        """Column values in header order: float arrays for numeric columns, string lists otherwise"""
+        return [values for values, _ in self._typed_columns]
+
+    @property
+    def units(self):
+        """Unit per column ('%', a currency symbol or None)"""
+        return [unit for _, unit in self._typed_columns]
+
+    def is_numeric(self, index):
+        """Whether the column at index was parsed as numbers"""
+        return isinstance(self._typed_columns[index][0], np.ndarray)
+
+    @cached_property
+    def records(self):
+        """Row-oriented JSON payload: one {header: cell} dict per row"""
+        return [
+            {header: row[i] for i, header in enumerate(self.headers) if i < len(row)}
+            for row in self.data
+        ]
+
+    @cached_property
+    def column_payload(self):
+        """Column-oriented JSON payload: one entry per column with its typed values"""
+        columns = []
+        for header, (values, unit) in zip(self.headers, self._typed_columns):
+            numeric = isinstance(values, np.ndarray)
+            columns.append({
+                "name": header,
+                "type": "number" if numeric else "string",
+                "unit": unit,
+                "values": [_json_value(value) for value in values.tolist()] if numeric else values
+            })
+        return columns
+
+    def to_dict(self, orient='rows'):
+        """
+        JSON payload for API responses
+
+        Args:
+            orient (str): 'rows' for the /extract row format (with the grid table),
+                'columns' for the smaller column-oriented format
+
+        Raises:
+            ValueError: If orient is not one of ORIENTS
+        """
+        if orient == 'rows':
+            return {
+                "title": self.title,
+                "headers": self.headers,
+                "data": self.records,
+                "formatted_table": self.formatted_table,
+                "raw_text": self.raw_output
+            }
+        if orient == 'columns':
+            return {
+                "title": self.title,
+                "orient": "columns",
+                "rows": len(self.data),
+                "columns": self.column_payload,
+                "raw_text": self.raw_output
+            }
+        raise ValueError(f"Unknown orient '{orient}', expected one of {', '.join(ORIENTS)}")
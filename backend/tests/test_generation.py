@@ -0,0 +1,27 @@
+from generation import ROW_SEPARATOR, TableCompleteCriteria, trim_stopped_outputs, trim_table_output
+
+
+class Tokenizer:
+    unk_token_id = 0
+
+    def convert_tokens_to_ids(self, token):
+        return 1
+
+
+COMPLETE = ROW_SEPARATOR.join(["TITLE | Sales", "Year | Sales", "2019 | 120", "2020 | 98"])
+RAGGED = ROW_SEPARATOR.join(["TITLE | Sales", "Year | Sales", "2019 | 120", "2020 | 98 | note", "2021 | 143"])
+
+
+def test_trim_drops_the_row_that_triggered_the_stop():
+    assert trim_table_output(COMPLETE + ROW_SEPARATOR + "2019 | 120") == COMPLETE
+
+
+def test_only_stopped_outputs_are_trimmed():
+    criterion = TableCompleteCriteria(Tokenizer())
+    criterion.stopped.add(0)
+    outputs = [COMPLETE + ROW_SEPARATOR + "2019 | 120", RAGGED]
+    assert trim_stopped_outputs(outputs, {'stopping_criteria': [criterion]}) == [COMPLETE, RAGGED]
+
+
+def test_outputs_without_the_criterion_are_kept():
+    assert trim_stopped_outputs([RAGGED], {}) == [RAGGED]
@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip('pandas')
+pytest.importorskip('numpy')
+pytest.importorskip('tabulate')
+pytest.importorskip('PIL')
+pytest.importorskip('requests')
+
+from query_engine import answer_question
+
+TABLE = ("Year | Sales | Profit\n2019 | 120 | 14\n2020 | 98 | 9\n"
+         "2021 | 143 | 21\n2022 | 171 | 26\n2023 | 160 | 22")
+
+
+@pytest.mark.parametrize('question, intent, fragment', [
+    ("Which year had the highest sales?", 'max', "171 (2022)"),
+    ("Which year has the least profit?", 'min', "9 (2020)"),
+    ("What is the total profit?", 'sum', "92"),
+    ("What is the average sales?", 'average', "138.4"),
+    ("How many years are shown?", 'count', "5 years"),
+    ("Total number of years", 'count', "5 years"),
+    ("What is the trend of sales?", 'trend', "increases overall"),
+    ("What was the profit in 2021?", 'lookup', "21"),
+    ("What is the sales difference between 2019 and 2022?", 'difference', "51"),
+])
+def test_answers(question, intent, fragment):
+    result = answer_question(question, TABLE)
+    assert result is not None
+    assert result.intent == intent
+    assert fragment in result.answer
+
+
+@pytest.mark.parametrize('question', [
+    "Which years had at least 100 sales?",
+    "What is the total number of sales?",
+    "How much did sales increase from 2019 to 2020?",
+    "Is the value of sales in 2020 greater than 2019?",
+    "Which year had the highest profit between 2019 and 2021?",
+    "Which years had sales above 150?",
+    "Why did sales drop in 2020?",
+])
+def test_ambiguous_questions_go_to_llm(question):
+    assert answer_question(question, TABLE) is None
+
+
+def test_duplicate_row_labels_are_not_looked_up():
+    table = "Region | Sales\nNorth | 10\nNorth | 20\nSouth | 5"
+    assert answer_question("What is the sales of North?", table) is None
+    assert answer_question("What is the difference between North and South?", table) is None
+    assert answer_question("What is the sales of South?", table).answer == "The Sales for South is 5."
+
+
+def test_growth_in_one_row_is_a_lookup():
+    table = "Year | Revenue | Growth\n2019 | 120 | 4.5\n2020 | 98 | -18.3\n2021 | 143 | 45.9"
+    result = answer_question("What was the growth in 2019?", table)
+    assert result.intent == 'lookup'
+    assert result.answer == "The Growth for 2019 is 4.5."
+    assert answer_question("What is the trend of growth?", table).intent == 'trend'
+
+
+def test_unparseable_table():
+    assert answer_question("What is the highest value?", "no table here") is None
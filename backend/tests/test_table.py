@@ -0,0 +1,77 @@
+import math
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('tabulate')
+
+from table import ChartTable, _parse_cell, parse_number
+
+
+@pytest.mark.parametrize('cell, expected', [
+    ('1,200', (1200.0, None)),
+    ('-2.1', (-2.1, None)),
+    ('.5', (0.5, None)),
+    ('45%', (45.0, '%')),
+    ('45 %', (45.0, '%')),
+    ('$3.5M', (3.5e6, '$')),
+    ('€10k', (1e4, '€')),
+    ('2bn', (2e9, None)),
+    ('1.2e3', (1200.0, None)),
+    ('1.5E-2', (0.015, None)),
+    ('5 kg', (5.0, None)),
+])
+def test_parse_cell_numbers(cell, expected):
+    number, unit = _parse_cell(cell)
+    assert number == pytest.approx(expected[0])
+    assert unit == expected[1]
+
+
+@pytest.mark.parametrize('cell', ['', '-', 'abc', '12abc', '3e', 'Q1', None])
+def test_parse_cell_non_numeric(cell):
+    assert _parse_cell(cell) == (None, None)
+    assert parse_number(cell) is None
+
+
+def test_typed_columns_and_units():
+    table = ChartTable('Share', ['Region', 'Share', 'Revenue'], [
+        ['North', '45%', '$1.2M'],
+        ['South', '30%', '$800k'],
+        ['East', '', '$2M'],
+    ], 'raw')
+    assert table.units == [None, '%', '$']
+    assert not table.is_numeric(0)
+    assert table.is_numeric(1) and table.is_numeric(2)
+    assert table.columns[0] == ['North', 'South', 'East']
+    assert table.columns[2].tolist() == [1.2e6, 8e5, 2e6]
+    assert math.isnan(table.columns[1][2])
+
+
+def test_mostly_text_column_stays_string():
+    table = ChartTable('', ['Label'], [['1'], ['a'], ['b']], '')
+    assert not table.is_numeric(0)
+    assert table.units == [None]
+
+
+def test_column_payload():
+    rows = [['North', '45%'], ['South', '30%'], ['East', '15%'], ['West', '10%'], ['Other', 'n/a']]
+    payload = ChartTable('Share', ['Region', 'Share'], rows, 'raw').to_dict('columns')
+    assert payload['orient'] == 'columns'
+    assert payload['rows'] == 5
+    assert payload['columns'] == [
+        {'name': 'Region', 'type': 'string', 'unit': None, 'values': ['North', 'South', 'East', 'West', 'Other']},
+        {'name': 'Share', 'type': 'number', 'unit': '%', 'values': [45.0, 30.0, 15.0, 10.0, None]},
+    ]
+
+
+def test_rows_payload_and_unknown_orient():
+    table = ChartTable('T', ['A', 'B'], [['x', '1']], 'raw')
+    assert table.to_dict('rows')['data'] == [{'A': 'x', 'B': '1'}]
+    with pytest.raises(ValueError):
+        table.to_dict('diagonal')
+
+
+def test_cache_round_trip():
+    table = ChartTable('T', ['A'], [['1']], 'raw')
+    restored = ChartTable.from_cache(table.to_cache())
+    assert (restored.title, restored.headers, restored.data, restored.raw_output) == ('T', ['A'], [['1']], 'raw')
@@ -0,0 +1,82 @@
+"""
+Tiny Pix2Struct - A randomly initialized, few-layer Pix2Struct model with a small built-in
+tokenizer, for benchmarks and tests that must run offline without the google/deplot weights
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Model id that makes the registry build this model instead of downloading a checkpoint
+TINY_MODEL_ID = 'tiny-random-pix2struct'
+
+# Vocabulary: T5's special tokens first (pad=0, eos=1, unk=2), then DePlot's row separator and
+# a few table symbols, then filler tokens up to VOCAB_SIZE
+SPECIAL_TOKENS = ['<pad>', '</s>', '<unk>']
+TABLE_TOKENS = ['<0x0A>', '|', 'TITLE'] + [str(i) for i in range(10)]
+VOCAB_SIZE = 512
+MAX_PATCHES = 256
+HIDDEN_SIZE = 64
+NUM_LAYERS = 2
+NUM_HEADS = 4
+
+
+def build_tokenizer():
+    """T5TokenizerFast over a word-level vocabulary built in memory (no files, no download)"""
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import T5TokenizerFast
+
+    vocab = SPECIAL_TOKENS + TABLE_TOKENS
+    vocab += [f"w{i}" for i in range(VOCAB_SIZE - len(vocab))]
+    backend = Tokenizer(models.WordLevel({token: i for i, token in enumerate(vocab)}, unk_token='<unk>'))
+    backend.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    return T5TokenizerFast(tokenizer_object=backend, eos_token='</s>', unk_token='<unk>',
+                           pad_token='<pad>', extra_ids=0)
+
+
+def build_tiny_pix2struct(seed=0):
+    """
+    Build a (processor, model) pair with random weights
+
+    The image processor is not in VQA mode: rendering the prompt as an image header
+    needs a font download, so the prompt is fed as a decoder prefix instead. Compute
+    per token is tiny, but the code path (patching, batched generate, stopping
+    criteria, decoding) is the same as for the real checkpoint.
+
+    Args:
+        seed (int): torch seed, so every run builds identical weights
+    """
+    import torch
+    from transformers import (Pix2StructConfig, Pix2StructForConditionalGeneration,
+                              Pix2StructImageProcessor, Pix2StructProcessor)
+
+    tokenizer = build_tokenizer()
+    image_processor = Pix2StructImageProcessor(is_vqa=False, max_patches=MAX_PATCHES)
+    processor = Pix2StructProcessor(image_processor=image_processor, tokenizer=tokenizer)
+
+    config = Pix2StructConfig(
+        text_config={
+            'vocab_size': len(tokenizer),
+            'hidden_size': HIDDEN_SIZE,
+            'd_kv': HIDDEN_SIZE // NUM_HEADS,
+            'd_ff': HIDDEN_SIZE * 2,
+            'num_layers': NUM_LAYERS,
+            'num_heads': NUM_HEADS,
+            'pad_token_id': 0,
+            'eos_token_id': 1,
+            'decoder_start_token_id': 0,
+        },
+        vision_config={
+            'hidden_size': HIDDEN_SIZE,
+            'patch_embed_hidden_size': 16 * 16 * 3,
+            'd_ff': HIDDEN_SIZE * 2,
+            'd_kv': HIDDEN_SIZE // NUM_HEADS,
+            'num_hidden_layers': NUM_LAYERS,
+            'num_attention_heads': NUM_HEADS,
+        },
+        is_vqa=False,
+    )
+    torch.manual_seed(seed)
+    model = Pix2StructForConditionalGeneration(config)
+    logger.info(f"Built {TINY_MODEL_ID} with {sum(p.numel() for p in model.parameters()):,} random parameters")
+    return processor, model